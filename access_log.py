@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+import streamlit as st
+from fetch_data import get_client
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_SPREADSHEET_ID = "1qUZaGkwv7Shx3gDnSQNdYFOjuqmVtRUEgKzdrBrsovM"
+
+# Sinks take a batch of [email, access_time] rows and write them in one call
+
+class SheetsSink:
+    def __init__(self, spreadsheet_id=ACCESS_LOG_SPREADSHEET_ID, client_factory=get_client):
+        self.spreadsheet_id = spreadsheet_id
+        self.client_factory = client_factory
+        self._sheet = None
+
+    def write(self, rows):
+        if self._sheet is None:
+            self._sheet = self.client_factory().open_by_key(self.spreadsheet_id).sheet1
+        self._sheet.append_rows(rows)
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def write(self, rows):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('a', encoding='utf-8') as file:
+            for email, access_time in rows:
+                file.write(json.dumps({'email': email, 'access_time': access_time}) + '\n')
+
+class SQLiteSink:
+    def __init__(self, path):
+        self.path = str(path)
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS access_log (email TEXT, access_time TEXT)')
+
+    def write(self, rows):
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany('INSERT INTO access_log VALUES (?, ?)', rows)
+
+
+# Process-wide access log: log() only enqueues, a background worker drains the queue
+# in batches, retries failed writes with exponential backoff and flushes on shutdown.
+# Shutdown cuts the backoff short and waits at most shutdown_timeout for the worker.
+class AccessLogWriter:
+    def __init__(self, sink, batch_size=100, flush_interval=2.0, max_retries=5, backoff=1.0, dedupe_size=10000,
+                 shutdown_timeout=5.0):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.dedupe_size = dedupe_size
+        self._queue = queue.Queue()
+        self._seen = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._stop = object()
+        self._stopping = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+        self._worker.start()
+        atexit.register(self.close, shutdown_timeout)
+
+    def log(self, email, session_id=None):
+        # One entry per (session, user): reruns of the same session are not logged again
+        key = (session_id, email)
+        with self._seen_lock:
+            if key in self._seen:
+                return False
+            self._seen[key] = True
+            if len(self._seen) > self.dedupe_size:
+                self._seen.popitem(last=False)
+        self._queue.put([email, datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        return True
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self, timeout=None):
+        # Once only: the atexit call after an explicit close() does not wait again
+        if self._worker.is_alive() and not self._stopping.is_set():
+            self._stopping.set()
+            self._queue.put(self._stop)
+            self._worker.join(timeout)
+            if self._worker.is_alive():
+                logger.error("Access log writer still busy after %ss at shutdown; pending entries are lost", timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, done = [], 1
+            if item is self._stop:
+                stopping = True
+            else:
+                batch.append(item)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                done += 1
+                if item is self._stop:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._write(batch)
+            for _ in range(done):
+                self._queue.task_done()
+
+    def _write(self, rows):
+        for attempt in range(self.max_retries):
+            try:
+                self.sink.write(rows)
+                return
+            except Exception:
+                logger.warning("Access log write failed (attempt %d/%d)", attempt + 1, self.max_retries, exc_info=True)
+                # Returns early (no more retries) once close() is called
+                if self._stopping.wait(self.backoff * 2 ** attempt):
+                    break
+        logger.error("Dropping %d access log entries after %d attempts", len(rows), attempt + 1)
+
+
+# Sink chosen by the optional [access_log] secrets section: sink = "sheets" (default),
+# "jsonl" or "sqlite", with path = "<file>" for the local sinks
+def make_sink(config):
+    sink = config.get('sink', 'sheets')
+    if sink == 'sheets':
+        return SheetsSink(config.get('spreadsheet_id', ACCESS_LOG_SPREADSHEET_ID))
+    if sink == 'jsonl':
+        return JsonlSink(config.get('path', 'access_log.jsonl'))
+    if sink == 'sqlite':
+        return SQLiteSink(config.get('path', 'access_log.sqlite'))
+    raise ValueError(f"Unknown access log sink: {sink}")
+
+@st.cache_resource
+def get_access_log():
+    return AccessLogWriter(make_sink(st.secrets.get('access_log', {})))
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Run from the repository root: python -m benchmarks.run --sizes 1000 10000
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Snapshots and the survey store go to a scratch directory and snapshots expire at once,
+# so every sheet load goes back to the (fake) sheet and the dashboard's own files are
+# never touched
+SCRATCH_DIR = Path(tempfile.mkdtemp(prefix='survey-benchmark-'))
+os.environ['SURVEY_SNAPSHOT_DIR'] = str(SCRATCH_DIR / 'snapshots')
+os.environ['SURVEY_STORE_DIR'] = str(SCRATCH_DIR / 'survey_store')
+os.environ['SURVEY_SNAPSHOT_TTL'] = '0'
+
+import numpy as np
+import pandas as pd
+import data_processing
+from access_log import AccessLogWriter, JsonlSink, SheetsSink, SQLiteSink
+from data_processing import categorize_segments
+from data_sources import FakeSheetsClient, SheetsSource
+from fetch_data import PRIOR_PARTICIPATION, SURVEY_SHEET, load_sheet
+from filter_index import FilterIndex, FrameView
+from ipa_engine import IPACells, ipa_table, sufficient_stats
+from score_cube import ScoreCube
+from snapshot import invalidate_snapshot, write_snapshot
+from benchmarks.synthetic import make_creds, make_sap, make_survey
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Same filter columns the IPA pages offer
+FILTER_COLUMNS = [
+    'unit', 'subunit', 'directorate', 'division', 'department', 'section',
+    'layer', 'status', 'generation', 'gender', 'marital', 'education',
+    'tenure_category', 'children', 'region', PRIOR_PARTICIPATION
+]
+
+# Wall time over `repeat` runs, then one extra run under tracemalloc for peak memory
+# (setup runs untimed before each run)
+def measure(stage, size, run, repeat=3, memory=True, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        run()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    record = {
+        'stage': stage, 'size': size, 'repeat': repeat,
+        'min_s': min(times), 'mean_s': sum(times) / len(times), 'peak_mb': peak_mb,
+    }
+    print(f"{size:>9} {stage:<20} {record['min_s'] * 1000:10.2f} ms"
+          + (f" {peak_mb:10.1f} MB" if peak_mb is not None else ''), file=sys.stderr)
+    return record, result
+
+# finalize_data with the fetch_data loaders replaced by the synthetic frames
+def run_finalize(df_survey, df_creds, df_sap):
+    data_processing.fetch_all_data = lambda: (df_survey, df_creds, df_sap)
+    data_processing._finalize_data.clear()
+    return data_processing.finalize_data()
+
+# Refresh after 1% new responses: a full run on the older rows, then only the new
+# rows are cleaned and appended (the lineage attrs mimic an appended snapshot)
+def prepare_incremental(df_survey, df_creds, df_sap, new_share=0.01):
+    base_rows = len(df_survey) - max(1, int(len(df_survey) * new_share))
+    df_base = df_survey.iloc[:base_rows].copy()
+    run_finalize(df_base, df_creds, df_sap)
+    state = dict(data_processing._last_finalized)
+    df_next = df_survey.copy()
+    df_next.attrs.update(revision=df_survey.attrs['revision'] + '+new', base_revision=df_base.attrs['revision'], base_rows=base_rows)
+    return state, df_next
+
+def run_incremental(state, df_next, df_creds, df_sap):
+    data_processing._last_finalized.clear()
+    data_processing._last_finalized.update(state)
+    return run_finalize(df_next, df_creds, df_sap)
+
+# The Sheets path offline: the survey sheet behind the Sheets stand-in is read in full
+# into a fresh snapshot, then 1% new rows are appended to the sheet and a refresh
+# fetches only those (read_since) onto the snapshot (append_snapshot)
+def prepare_sheet(df_survey, new_share=0.01):
+    base_rows = len(df_survey) - max(1, int(len(df_survey) * new_share))
+    client = FakeSheetsClient({SURVEY_SHEET: df_survey.iloc[:base_rows]})
+    return client, SheetsSource(client_factory=lambda: client), base_rows
+
+def run_sheet_load(source):
+    invalidate_snapshot(SURVEY_SHEET)
+    return load_sheet(SURVEY_SHEET, source)
+
+def append_sheet_rows(client, df_new):
+    client.open(SURVEY_SHEET).sheet1.append_rows(df_new.astype(object).to_numpy().tolist())
+
+def check_sheet_append(df, base_rows, n_rows):
+    if df.attrs.get('base_rows') != base_rows or len(df) != n_rows:
+        raise RuntimeError(f"Sheet refresh appended {len(df) - base_rows} rows onto {df.attrs.get('base_rows')}, "
+                           f"expected {n_rows - base_rows} onto {base_rows}")
+    return df
+
+def count_lines(path):
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+# Access log entries through the background writer into each offline sink (and the
+# Sheets sink on the stand-in client); the written row count is checked after flush
+def make_sinks(client):
+    return {
+        'jsonl': (JsonlSink(SCRATCH_DIR / 'access_log.jsonl'),
+                  lambda: count_lines(SCRATCH_DIR / 'access_log.jsonl')),
+        'sqlite': (SQLiteSink(SCRATCH_DIR / 'access_log.sqlite'),
+                   lambda: sqlite3.connect(SCRATCH_DIR / 'access_log.sqlite').execute('SELECT COUNT(*) FROM access_log').fetchone()[0]),
+        'sheets': (SheetsSink('access-log', client_factory=lambda: client),
+                   lambda: len(client.open_by_key('access-log').sheet1.rows)),
+    }
+
+def run_access_log(sink, written, entries):
+    before = written()
+    writer = AccessLogWriter(sink, flush_interval=0.05)
+    for entry in range(entries):
+        writer.log(f'user{entry}@example.com', session_id=entry)
+    writer.close()
+    if written() - before != entries:
+        raise RuntimeError(f"Access log wrote {written() - before} of {entries} entries")
+
+# What make_filter does for three cascading filters: options, bitmap AND, row view
+def run_filter(index, df, selections):
+    bitmap = index.all_rows()
+    for column, values in selections.items():
+        index.options(column, bitmap)
+        bitmap = bitmap & index.bitmap(column, values)
+    return FrameView(df, index.positions(bitmap))
+
+def pick_selections(df, columns=('unit', 'layer', 'generation')):
+    # The most common value of each column, so the filtered slice is never empty
+    return {column: [df[column].value_counts().index[0]] for column in columns}
+
+def benchmark_size(size, repeat, memory, seed):
+    records = []
+
+    def add(stage, run, stage_repeat=repeat, setup=None):
+        record, result = measure(stage, size, run, stage_repeat, memory, setup)
+        records.append(record)
+        return result
+
+    df_survey_raw, df_sap = add('generate', lambda: (make_survey(size, seed), make_sap(size // 4, seed + 1)), 1)
+    df_creds = make_creds()
+
+    client, source, base_rows = prepare_sheet(df_survey_raw)
+    df_sheet = add('sheet_load', lambda: run_sheet_load(source))
+    append_sheet_rows(client, df_survey_raw.iloc[base_rows:])
+    add('sheet_append', lambda: check_sheet_append(load_sheet(SURVEY_SHEET, source), base_rows, len(df_survey_raw)),
+        setup=lambda: write_snapshot(SURVEY_SHEET, df_sheet))
+    for name, (sink, written) in make_sinks(client).items():
+        add(f'access_log_{name}', lambda: run_access_log(sink, written, min(size, 10_000)))
+
+    df_survey, _, combined_df = add('finalize_data', lambda: run_finalize(df_survey_raw, df_creds, df_sap))
+    state, df_next = prepare_incremental(df_survey_raw, df_creds, df_sap)
+    add('finalize_incremental', lambda: run_incremental(state, df_next, df_creds, df_sap))
+
+    index = add('filter_index_build', lambda: FilterIndex(df_survey, FILTER_COLUMNS))
+    selections = pick_selections(df_survey)
+    add('filter_query', lambda: run_filter(index, df_survey, selections))
+
+    add('segmentation', lambda: categorize_segments(df_survey))
+    add('ipa_regression', lambda: ipa_table(sufficient_stats(df_survey)))
+    cells = add('ipa_cells_build', lambda: IPACells(df_survey, FILTER_COLUMNS))
+    add('ipa_cells_query', lambda: cells.ipa_table(selections))
+    score_cube = add('score_cube_build', lambda: ScoreCube(df_survey, combined_df, FILTER_COLUMNS))
+    add('score_cube_query', lambda: (score_cube.segment(selections), score_cube.heatmap(['generation'], selections)))
+
+    for record in records:
+        record['rows_survey'] = len(df_survey)
+        record['rows_combined'] = len(combined_df)
+    return records
+
+def git_revision():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+# Ratio of current to previous min time per (size, stage); > 1 means slower
+def compare(previous, current):
+    before = {(record['size'], record['stage']): record['min_s'] for record in previous['results']}
+    rows = []
+    for record in current['results']:
+        key = (record['size'], record['stage'])
+        if key in before and before[key] > 0:
+            rows.append({'size': key[0], 'stage': key[1], 'ratio': record['min_s'] / before[key]})
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard pipeline on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run of each stage')
+    parser.add_argument('--output', type=Path, help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', type=Path, help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(benchmark_size(size, args.repeat, not args.no_memory, args.seed))
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    report = {'environment': environment(), 'results': results}
+    if args.compare:
+        report['comparison'] = compare(json.loads(args.compare.read_text()), report)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from data_processing import NIK_OVERRIDES
+from fetch_data import PRIOR_PARTICIPATION
+from survey_schema import DIMENSION_ITEMS, ITEM_SCALES, SCALES
+
+# The 21 SAP columns finalize_data selects, with plausible values per column
+DEMOGRAPHIC_VALUES = {
+    'unit': ['GOMED', 'GOMAN', 'YMN', 'CORCOMM', 'KGP', 'GORP', 'KGH'],
+    'subunit': ['GOMED', 'GRID', 'TRIBUN', 'KONTAN', 'KOMPAS TV', 'HARKOM', 'YMN', 'DIGITAL'],
+    'generation': ['Gen Z', 'Millennial', 'Gen X', 'Baby Boomer'],
+    'gender': ['Laki-laki', 'Perempuan'],
+    'religion': ['Islam', 'Kristen', 'Katolik', 'Hindu', 'Buddha'],
+    'status': ['Tetap', 'Kontrak', 'Probation', ''],
+    'directorate': [f'DIR {i}' for i in range(8)] + [0],
+    'division': [f'DIV {i}' for i in range(40)] + [''],
+    'division_gohr': [f'GOHR {i}' for i in range(10)],
+    'department': [f'DEPT {i}' for i in range(150)] + ['', 0],
+    'section': [f'SECT {i}' for i in range(300)] + ['', 0],
+    'position': [f'POS {i}' for i in range(500)],
+    'region': ['Jakarta', 'Jawa Barat', 'Jawa Tengah', 'Jawa Timur', 'Bali', 'Sumatera', 'Kalimantan', 'Sulawesi'],
+    'marital': ['Cerai', 'Lajang', 'Nikah'],
+    'children': [0, 1, 2, 3, 4],
+    'education': ['SMA', 'D1', 'D2', 'D3', 'D4', 'S1', 'S2', 'S3'],
+    PRIOR_PARTICIPATION: ['YES', 'NO'],
+    'layer': ['Group 1', 'Group 1 Str Layer 5', 'Group 2', 'Group 2 Str Layer 4', 'Group 3',
+              'Group 3 Str Layer 3A', 'Group 3 Str Layer 3B', 'Group 4', 'Group 4 Str Layer 2', '#VALUE!'],
+    'subdivision': [f'SUBDIV {i}' for i in range(60)],
+}
+SAP_COLUMNS = ['nik', 'unit', 'subunit', 'generation', 'gender', 'religion', 'tenure',
+               'status', 'directorate', 'division', 'division_gohr',
+               'department', 'section', 'position', 'region', 'marital', 'children', 'education',
+               PRIOR_PARTICIPATION, 'layer', 'subdivision']
+
+# Object columns with '#N/A' noise, shaped like get_all_records() output
+def _demographics(rng, n_rows, nik_start, na_rate):
+    frame = {}
+    niks = np.arange(nik_start, nik_start + n_rows, dtype=object)
+    override_niks = list(NIK_OVERRIDES)
+    reassigned = rng.random(n_rows) < min(0.01, len(override_niks) / max(n_rows, 1))
+    niks[reassigned] = rng.choice(np.array(override_niks, dtype=object), reassigned.sum())
+    frame['nik'] = niks
+    for column in SAP_COLUMNS[1:]:
+        if column == 'tenure':
+            frame[column] = rng.integers(0, 35, n_rows)
+            continue
+        values = rng.choice(np.array(DEMOGRAPHIC_VALUES[column], dtype=object), n_rows)
+        values[rng.random(n_rows) < na_rate] = '#N/A'
+        frame[column] = values
+    return frame
+
+# Survey responses: demographics plus correlated 1-5 Likert items, SAT and 0-10 NPS
+def make_survey(n_rows, seed=0, na_rate=0.02):
+    rng = np.random.default_rng(seed)
+    frame = _demographics(rng, n_rows, 1, na_rate)
+    mood = rng.normal(0, 1, n_rows)
+    for column in DIMENSION_ITEMS:
+        latent = 0.6 * mood + rng.normal(0, 1, n_rows)
+        frame[column] = np.clip(np.round(3 + latent), *SCALES[ITEM_SCALES[column]]).astype(int)
+    ke0 = frame['KE0'].astype(object)
+    ke0[rng.random(n_rows) < 0.05] = '#N/A'
+    frame['KE0'] = ke0
+    frame['SAT'] = np.clip(np.round(3 + mood + rng.normal(0, 0.7, n_rows)), *SCALES[ITEM_SCALES['SAT']]).astype(int)
+    frame['NPS'] = np.clip(np.round(6 + 2 * mood + rng.normal(0, 1.5, n_rows)), *SCALES[ITEM_SCALES['NPS']]).astype(int)
+    df_survey = pd.DataFrame(frame)
+    df_survey.attrs['revision'] = f'synthetic-survey-{n_rows}-{seed}'
+    return df_survey
+
+# SAP population of employees who have not answered yet
+def make_sap(n_rows, seed=1, na_rate=0.02):
+    rng = np.random.default_rng(seed)
+    df_sap = pd.DataFrame(_demographics(rng, n_rows, 10**7, na_rate))
+    df_sap.attrs['revision'] = f'synthetic-sap-{n_rows}-{seed}'
+    return df_sap
+
+def make_creds(n_rows=50):
+    df_creds = pd.DataFrame({
+        'username': [f'user{i}' for i in range(n_rows)],
+        'name': [f'User {i}' for i in range(n_rows)],
+        'password': ['$2b$12$' + 'x' * 53] * n_rows,
+        'unit': np.resize(DEMOGRAPHIC_VALUES['unit'], n_rows),
+        'email': [f'user{i}@example.com' for i in range(n_rows)],
+    })
+    df_creds.attrs['revision'] = f'synthetic-creds-{n_rows}'
+    return df_creds
@@ -1,137 +1,345 @@
+import logging
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 import pandas as pd
 import numpy as np
-from fetch_data import fetch_data_survey, fetch_data_creds, fetch_data_sap
+from fetch_data import PRIOR_PARTICIPATION, SURVEY_YEAR, fetch_all_data, fetch_data_creds, data_revision
+from snapshot import SNAPSHOT_TTL
+from survey_schema import ITEM_COLUMNS, score_dimensions
+from survey_store import read_waves, stored_years, wave_info, write_wave
+from tracing import annotate, mark_miss, span
 
-#@st.cache_data()
+# The finalized frames are cached and shared by every session: with copy-on-write,
+# slices and projections taken from them share memory until written, and writes to
+# a derived frame never reach the shared one
+pd.set_option('mode.copy_on_write', True)
+
+logger = logging.getLogger(__name__)
+
+# List penugasan
+NIK_OVERRIDES = {
+    5382: {'unit': 'CORCOMM', 'subunit': 'CORCOMM'},
+    28009: {'unit': 'GOMED', 'subunit': 'GRID'},
+    1536: {'unit': 'GOMED', 'subunit': 'KONTAN'},
+    5135: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    1416: {'unit': 'YMN', 'subunit': 'YMN'},
+    4469: {'unit': 'YMN', 'subunit': 'YMN'},
+    1375: {'unit': 'GOMED', 'subunit': 'HARKOM'},
+    1376: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    2002: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    2751: {'unit': 'GOMED', 'subunit': 'GRID'},
+    2975: {'unit': 'GOMAN', 'subunit': 'GOMAN'},
+    3316: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    3392: {'unit': 'GOMED', 'subunit': 'GRID'},
+    3412: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    4520: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    4521: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    4982: {'unit': 'GOMAN', 'subunit': 'GOMAN'},
+    5035: {'unit': 'GOMED', 'subunit': 'GRID'},
+    5584: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    5951: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    6097: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    6149: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    10239: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    12691: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    14956: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    16446: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    18196: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    19474: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    22264: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
+    23163: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    24377: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
+    28962: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
+    35202: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    35318: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    35439: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    35689: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    35859: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    35896: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    39763: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    42342: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    62757: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    26832: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    100013: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    26822: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    100027: {'unit': 'YMN', 'subunit': 'DIGITAL'},
+    100001: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    81563: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    23945: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    27259: {'unit': 'GOMED', 'subunit': 'GOMED'},
+    59284: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    61032: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    24870: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    76975: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    86635: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    27011: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
+    74900: {'unit': 'GOMED', 'subunit': 'GRID'},
+    17261: {'unit': 'GOMED', 'subunit': 'GRID'},
+    1551: {'unit': 'GOMED', 'subunit': 'GRID'},
+    4042: {'unit': 'GOMED', 'subunit': 'GRID'},
+    37520: {'unit': 'GOMED', 'subunit': 'GRID'}
+}
+
+# Normalization spec: column -> missing tokens (replaced by 'fill', default '-'),
+# value mappings, and the sources the rule applies to (default: every frame)
+NORMALIZATION_SPEC = {
+    'directorate': {'missing': [0, '#N/A']},
+    'division': {'missing': ['', '#N/A']},
+    'department': {'missing': ['', '#N/A', 0]},
+    'section': {'missing': ['', '#N/A', 0]},
+    'layer': {'missing': ['#N/A', '#VALUE!']},
+    'marital': {'missing': ['#N/A'], 'map': {'Cerai': 'Duda/Janda', 'Lajang': 'Belum Menikah', 'Nikah': 'Sudah Menikah'}},
+    'education': {'missing': ['#N/A'], 'map': {'D1': 'Diploma', 'D2': 'Diploma', 'D3': 'Diploma', 'D4': 'Diploma'}},
+    'children': {'missing': ['#N/A']},
+    'status': {'missing': [''], 'sources': ['sap']},
+    PRIOR_PARTICIPATION: {'missing': ['#N/A'], 'fill': 'NO', 'sources': ['sap']},
+    'unit': {'map': {'GOMED': 'KG MEDIA'}},
+    'subunit': {'map': {'GOMED': 'KG MEDIA'}},
+}
+
+# Apply the NIK overrides with a single indexed lookup instead of one scan per NIK
+def apply_overrides(df, overrides=NIK_OVERRIDES):
+    table = pd.DataFrame.from_dict(overrides, orient='index')
+    assigned = table.reindex(df['nik'].to_numpy())
+    matched = assigned.notna().all(axis=1).to_numpy()
+    df = df.copy()
+    for column in table.columns:
+        df[column] = df[column].where(~matched, assigned[column].to_numpy())
+    return df
+
+# Apply the normalization spec to several frames at once: the spec columns of every
+# frame are stacked and each group of rules runs as one nested-dict replace
+def normalize_frames(frames, spec=NORMALIZATION_SPEC):
+    columns = list(spec)
+    stacked = pd.concat([df[columns] for df in frames.values()], ignore_index=True)
+    source = np.repeat(list(frames), [len(df) for df in frames.values()])
+
+    rules_by_sources = {}
+    for column, rule in spec.items():
+        mapping = dict.fromkeys(rule.get('missing', []), rule.get('fill', '-'))
+        mapping.update(rule.get('map', {}))
+        sources = tuple(rule.get('sources', frames))
+        rules_by_sources.setdefault(sources, {})[column] = mapping
+
+    for sources, replacements in rules_by_sources.items():
+        rule_columns = list(replacements)
+        # No silent downcasting: the infer_objects below settles the dtypes per frame
+        with pd.option_context('future.no_silent_downcasting', True):
+            replaced = stacked[rule_columns].replace(replacements)
+        if set(sources) != set(frames):
+            in_scope = np.isin(source, sources)[:, None]
+            replaced = replaced.where(np.broadcast_to(in_scope, replaced.shape), stacked[rule_columns])
+        stacked[rule_columns] = replaced
+
+    normalized = {}
+    offset = 0
+    for name, df in frames.items():
+        part = stacked.iloc[offset:offset + len(df)].set_axis(df.index).infer_objects()
+        normalized[name] = df.assign(**part)
+        offset += len(df)
+    return normalized
+
+# LS/NPS segmentation rules: each segment is a (high/low, high/low) cell of two axes,
+# where 'high' means value >= high threshold and 'low' means value <= low threshold.
+# Rows in no segment get the default label.
+SEGMENT_RULES = {
+    'LS_Category': {
+        'axes': ('SAT', 'KE1'),
+        'high': (4, 4),
+        'low': (2, 2),
+        'segments': {
+            ('high', 'high'): 'Loyal Enthusiast',
+            ('high', 'low'): 'Contented Wanderers',
+            ('low', 'high'): 'Reluctant Stayers',
+            ('low', 'low'): 'Disengaged Flight to Risk',
+        },
+        'default': 'Neutral',
+    },
+    'NPS_Category': {
+        'axes': ('SAT', 'NPS'),
+        'high': (4, 9),
+        'low': (2, 6),
+        'segments': {
+            ('high', 'high'): 'Brand Champions',
+            ('high', 'low'): 'Satisfied Critics',
+            ('low', 'high'): 'Loyal Promoters',
+            ('low', 'low'): 'Vocal Detractors',
+        },
+        'default': 'Neutral',
+    },
+}
+
+# Evaluate the segmentation rules on whole columns; results are Categoricals whose
+# categories are the default label followed by the segments in rule order
+def categorize_segments(df, rules=SEGMENT_RULES):
+    segments = {}
+    for column, rule in rules.items():
+        levels = []
+        for axis, high, low in zip(rule['axes'], rule['high'], rule['low']):
+            values = pd.to_numeric(df[axis], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            levels.append({'high': values >= high, 'low': values <= low})
+        labels = list(rule['segments'].values())
+        conditions = [levels[0][first] & levels[1][second] for first, second in rule['segments']]
+        codes = np.select(conditions, range(1, len(labels) + 1), default=0)
+        segments[column] = pd.Categorical.from_codes(codes, [rule['default']] + labels)
+    return df.assign(**segments)
+
+# Demographic columns stored as Categoricals (categories shared by survey and SAP frames)
+CATEGORICAL_COLUMNS = [
+    'unit', 'subunit', 'directorate', 'division', 'department', 'section',
+    'layer', 'status', 'generation', 'gender', 'marital', 'education',
+    'tenure_category', 'children', 'region', PRIOR_PARTICIPATION, 'religion',
+    'division_gohr', 'position', 'subdivision',
+]
+
+def memory_usage_mb(*frames):
+    return sum(df.memory_usage(deep=True).sum() for df in frames) / 2**20
+
+# Shrink the cleaned frames: demographics to Categoricals with one category set per
+# column across both frames (so concat keeps them categorical), items to Int8.
+# base_dtypes: categoricals of already cleaned rows the new categories extend
+def optimize_dtypes(df_survey, df_sap_selected, base_dtypes=None):
+    before = memory_usage_mb(df_survey, df_sap_selected)
+    frames = [df_survey, df_sap_selected]
+
+    categoricals = {}
+    as_text = []
+    for column in CATEGORICAL_COLUMNS:
+        present = [df[column] for df in frames if column in df.columns]
+        if not present:
+            continue
+        # Categories of earlier rows come first (see extend_categories), then those of
+        # columns that are categorical already, so tenure_category keeps its bin order
+        known = list(base_dtypes[column].categories) if base_dtypes and column in base_dtypes else []
+        existing = [series.dtype for series in present if isinstance(series.dtype, pd.CategoricalDtype)]
+        for dtype in existing:
+            known += list(dtype.categories)
+        values = pd.unique(np.concatenate([np.asarray(known, dtype=object)] + [np.asarray(series, dtype=object) for series in present]))
+        categories = [value for value in values if not pd.isna(value)]
+        # Columns mixing numbers and '-' (e.g. children) become text, as Arrow needs
+        # one type per categorical
+        if len({type(value) for value in categories}) > 1:
+            categories = list(dict.fromkeys(str(value) for value in categories))
+            as_text.append(column)
+        categoricals[column] = pd.CategoricalDtype(categories, ordered=any(dtype.ordered for dtype in existing))
+
+    frames = [
+        df.assign(**{column: df[column].where(df[column].isna(), df[column].astype(str)) for column in as_text if column in df.columns})
+        for df in frames
+    ]
+    df_survey, df_sap_selected = frames
+
+    # Every answer scale (see survey_schema.SCALES) fits in a nullable int8
+    items = [column for column in ITEM_COLUMNS if column in df_survey.columns]
+    df_survey = df_survey.assign(**{
+        column: pd.to_numeric(df_survey[column], errors='coerce').round().astype('Int8')
+        for column in items
+    })
+    df_survey, df_sap_selected = [
+        df.astype({column: dtype for column, dtype in categoricals.items() if column in df.columns})
+        for df in (df_survey, df_sap_selected)
+    ]
+
+    after = memory_usage_mb(df_survey, df_sap_selected)
+    logger.info("finalize_data dtype optimization: %.1f MB -> %.1f MB", before, after)
+    # Shown with the finalize_data stage on the metrics page (an incremental refresh
+    # optimizes, and so reports, only the appended rows)
+    annotate(optimized_rows=len(df_survey) + len(df_sap_selected),
+             memory_before_mb=round(before, 1), memory_after_mb=round(after, 1))
+    return df_survey, df_sap_selected
+
+# Cleaned outputs are computed once per source revision and shared read-only
+# across sessions, so callers must not modify the returned frames in place
 def finalize_data():
-    df_survey = fetch_data_survey()
-    df_creds = fetch_data_creds()
-    df_sap = fetch_data_sap()
-   
-    # Example: Drop rows where 'column_name' has the value 'value_to_drop'
-    df_survey = df_survey[df_survey['unit'] != '#N/A']
+    with span('fetch_all_data', cached=True):
+        df_survey, df_creds, df_sap = fetch_all_data()
+    with span('finalize_data', cached=True) as traced:
+        result = _finalize_data(data_revision(df_survey, df_creds, df_sap), df_survey, df_creds, df_sap)
+        traced.rows = len(result[0])
+    return result
 
+SAP_COLUMNS = ['nik', 'unit', 'subunit', 'generation','gender', 'religion','tenure', 
+               'status','directorate','division','division_gohr',
+               'department','section', 'position','region','marital','children',	'education',PRIOR_PARTICIPATION, 'layer','subdivision']
 
-    df_sap_selected = df_sap[['nik', 'unit', 'subunit', 'generation','gender', 'religion','tenure', 
-                              'status','directorate','division','division_gohr',
-                              'department','section', 'position','region','marital','children',	'education','participation_23', 'layer','subdivision']]
-
-    # List penugasan
-    update_list = {
-        5382: {'unit': 'CORCOMM', 'subunit': 'CORCOMM'},
-        28009: {'unit': 'GOMED', 'subunit': 'GRID'},
-        1536: {'unit': 'GOMED', 'subunit': 'KONTAN'},
-        5135: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        1416: {'unit': 'YMN', 'subunit': 'YMN'},
-        4469: {'unit': 'YMN', 'subunit': 'YMN'},
-        1375: {'unit': 'GOMED', 'subunit': 'HARKOM'},
-        1376: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        2002: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        2751: {'unit': 'GOMED', 'subunit': 'GRID'},
-        2975: {'unit': 'GOMAN', 'subunit': 'GOMAN'},
-        3316: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        3392: {'unit': 'GOMED', 'subunit': 'GRID'},
-        3412: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        4520: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        4521: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        4982: {'unit': 'GOMAN', 'subunit': 'GOMAN'},
-        5035: {'unit': 'GOMED', 'subunit': 'GRID'},
-        5584: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        5951: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        6097: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        6149: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        10239: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        12691: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        14956: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        16446: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        18196: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        19474: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        22264: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
-        23163: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        24377: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
-        28962: {'unit': 'GOMED', 'subunit': 'KOMPAS TV'},
-        35202: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        35318: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        35439: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        35689: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        35859: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        35896: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        39763: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        42342: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        62757: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        26832: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        100013: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        26822: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        100027: {'unit': 'YMN', 'subunit': 'DIGITAL'},
-        100001: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        81563: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        23945: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        27259: {'unit': 'GOMED', 'subunit': 'GOMED'},
-        59284: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        61032: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        24870: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        76975: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        86635: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        27011: {'unit': 'GOMED', 'subunit': 'TRIBUN'},
-        74900: {'unit': 'GOMED', 'subunit': 'GRID'},
-        17261: {'unit': 'GOMED', 'subunit': 'GRID'},
-        1551: {'unit': 'GOMED', 'subunit': 'GRID'},
-        4042: {'unit': 'GOMED', 'subunit': 'GRID'},
-        37520: {'unit': 'GOMED', 'subunit': 'GRID'}
-    }
-    
-    # Iterate over the update list and update the DataFrame
-    for nik, values in update_list.items():
-        df_survey.loc[df_survey['nik'] == nik, ['unit', 'subunit']] = [values['unit'], values['subunit']]
-
-    # Replacing missing value
-    df_survey['directorate'] = df_survey['directorate'].replace([0,'#N/A'],'-')
-    df_survey['division'] = df_survey['division'].replace(['','#N/A'],'-')
-    df_survey['department'] = df_survey['department'].replace(['','#N/A',0],'-')
-    df_survey['section'] = df_survey['section'].replace(['','#N/A',0],'-')
-    df_survey['layer'] = df_survey['layer'].replace(['#N/A','#VALUE!'],'-')
-    df_survey['marital'] = df_survey['marital'].replace({'#N/A':'-', 'Cerai':'Duda/Janda', 'Lajang':'Belum Menikah', 'Nikah':'Sudah Menikah'})
-    df_survey['education'] = df_survey['education'].replace({'#N/A':'-', 'D1':'Diploma', 'D2':'Diploma', 'D3':'Diploma', 'D4':'Diploma'})
-    df_survey['children'] = df_survey['children'].replace('#N/A','-')
-    df_survey['unit'] = df_survey['unit'].replace('GOMED','KG MEDIA')
-    df_survey['subunit'] = df_survey['subunit'].replace('GOMED','KG MEDIA')
-    df_sap_selected['directorate'] = df_sap_selected['directorate'].replace([0,'#N/A'],'-')
-    df_sap_selected['division'] = df_sap_selected['division'].replace(['','#N/A'],'-')
-    df_sap_selected['department'] = df_sap_selected['department'].replace(['','#N/A',0],'-')
-    df_sap_selected['section'] = df_sap_selected['section'].replace(['','#N/A',0],'-')
-    df_sap_selected['layer'] = df_sap_selected['layer'].replace(['#N/A','#VALUE!'],'-')
-    df_sap_selected['marital'] = df_sap_selected['marital'].replace({'#N/A':'-', 'Cerai':'Duda/Janda', 'Lajang':'Belum Menikah', 'Nikah':'Sudah Menikah'})
-    df_sap_selected['education'] = df_sap_selected['education'].replace({'#N/A':'-', 'D1':'Diploma', 'D2':'Diploma', 'D3':'Diploma', 'D4':'Diploma'})
-    df_sap_selected['children'] = df_sap_selected['children'].replace('#N/A','-')
-    df_sap_selected['status'] = df_sap_selected['status'].replace('','-')
-    df_sap_selected['participation_23'] = df_sap_selected['participation_23'].replace('#N/A','NO')
-    df_sap_selected['unit'] = df_sap_selected['unit'].replace('GOMED','KG MEDIA')
-    df_sap_selected['subunit'] = df_sap_selected['subunit'].replace('GOMED','KG MEDIA')
+TENURE_BINS = [0, 1, 3, 6, 10, 15, 20, 25, float('inf')]
+TENURE_LABELS = ['<1', '1-3', '3-6', '6-10', '10-15', '15-20', '20-25', '>25']
 
+def add_tenure_category(df):
     # Categorizing tenure
     # Convert the 'tenure' column to numeric, replacing errors with NaN
     #df_survey['tenure'] = pd.to_numeric(df_survey['tenure'], errors='coerce')
+    df['tenure_category'] = pd.cut(df['tenure'], bins=TENURE_BINS, labels=TENURE_LABELS, right=False)
+    return df
+
+# Row-wise scoring of cleaned survey rows; every derived column depends only on its own
+# row, so newly appended responses can be scored on their own
+def score_survey(df_survey):
+    df_survey = add_tenure_category(df_survey)
+
+    # Fill KE0 ('#N/A' or 0) from KE1-KE3 and compute every dimension average, all
+    # from the item-by-dimension weights of survey_schema
+    df_survey = df_survey.assign(**score_dimensions(df_survey))
 
-    bins = [0, 1, 3, 6, 10, 15, 20, 25, float('inf')]
-    labels = ['<1', '1-3', '3-6', '6-10', '10-15', '15-20', '20-25', '>25']
+    # LS/NPS segments, computed once here so pages only read the columns
+    return categorize_segments(df_survey)
 
-    # Apply categorization
-    df_survey['tenure_category'] = pd.cut(df_survey['tenure'], bins=bins, labels=labels, right=False)
-    df_sap_selected['tenure_category'] = pd.cut(df_sap_selected['tenure'], bins=bins, labels=labels, right=False)
+# Drop rows without a unit and reassign NIKs to their penugasan unit
+def clean_survey_rows(df_survey):
+    # Example: Drop rows where 'column_name' has the value 'value_to_drop'
+    df_survey = df_survey[df_survey['unit'] != '#N/A']
+    return apply_overrides(df_survey)
+
+def categorical_dtypes(df):
+    return {column: df[column].dtype for column in CATEGORICAL_COLUMNS
+            if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)}
+
+# Widen cached frames to categories that were appended for new rows; the existing
+# categories keep their positions, so the stored codes stay valid
+def extend_categories(df, dtypes):
+    updates = {}
+    for column, dtype in dtypes.items():
+        if column in df.columns and df[column].dtype != dtype:
+            known = len(df[column].cat.categories)
+            updates[column] = (df[column].cat.rename_categories(list(dtype.categories[:known]))
+                               .cat.add_categories(list(dtype.categories[known:])))
+    return df.assign(**updates) if updates else df
+
+# State of the last full or incremental run, extended when the survey snapshot only
+# gained rows at the bottom (see snapshot.append_snapshot)
+_last_finalized = {}
+_last_finalized_lock = threading.Lock()
+
+@st.cache_resource(max_entries=2)
+def _finalize_data(revision, _df_survey, _df_creds, _df_sap):
+    mark_miss()
+    with _last_finalized_lock:
+        previous = dict(_last_finalized)
+    if (previous and _df_survey.attrs.get('base_revision') == previous['revision'][0]
+            and _df_survey.attrs.get('base_rows') == previous['raw_rows']):
+        result = _append_survey_rows(previous, revision, _df_survey, _df_sap)
+    else:
+        result = _clean_all(_df_survey, _df_sap)
+    df_survey, df_sap_selected = result
 
-    # Replace '#N/A' and 0 with NaN, and fill NaN in KE0 with the average of KE1, KE2, KE3
-    df_survey['KE0'] = pd.to_numeric(df_survey['KE0'], errors='coerce').replace(0, np.nan)
-    df_survey['KE0'] = df_survey['KE0'].fillna(df_survey[['KE1', 'KE2', 'KE3']].mean(axis=1).round(0).astype(int))
+    combined_df = pd.concat([df_survey, df_sap_selected], ignore_index=True)
+
+    # Lets derived stores (IPA cube) tell which source revision they were built from
+    df_survey.attrs['source_revision'] = '/'.join(revision)
+    with _last_finalized_lock:
+        _last_finalized.update(revision=revision, raw_rows=len(_df_survey), df_survey=df_survey, df_sap_selected=df_sap_selected)
+    return df_survey, _df_creds, combined_df
+
+def _clean_all(df_survey, df_sap):
+    df_survey = clean_survey_rows(df_survey)
+    df_sap_selected = df_sap[SAP_COLUMNS]
 
+    # Normalize both frames in one pass
+    df_survey, df_sap_selected = normalize_frames({'survey': df_survey, 'sap': df_sap_selected}).values()
 
-    # Calculate the average for each dimension and round to 1 decimal place
-    df_survey['average_kd'] = df_survey[['KD1', 'KD2', 'KD3', 'KD0']].mean(axis=1).round(2)
-    df_survey['average_ki'] = df_survey[['KI1', 'KI2', 'KI3', 'KI4', 'KI5', 'KI0']].mean(axis=1).round(2)
-    df_survey['average_kr'] = df_survey[['KR1', 'KR2', 'KR3', 'KR4', 'KR5', 'KR0']].mean(axis=1).round(2)
-    df_survey['average_pr'] = df_survey[['PR1', 'PR2', 'PR0']].mean(axis=1).round(2)
-    df_survey['average_tu'] = df_survey[['TU1', 'TU2', 'TU0']].mean(axis=1).round(2)
-    df_survey['average_ke'] = df_survey[['KE1', 'KE2', 'KE3', 'KE0']].mean(axis=1).round(2)
+    df_survey = score_survey(df_survey)
+    df_sap_selected = add_tenure_category(df_sap_selected)
 
     # Calculate overall satisfaction by averaging all items directly and round to 1 decimal place
     #df_survey['overall_satisfaction'] = df_survey[['KD1', 'KD2', 'KD3', 'KD0', 
@@ -159,5 +367,106 @@ def finalize_data():
     #    else:
     #        with st.expander(f"{column.capitalize()}"):
     #            st.write("Column not available in the data.")
+    return optimize_dtypes(df_survey, df_sap_selected)
+
+# Incremental refresh: clean and score only the raw rows past the previous run and
+# append them; the SAP frame is re-cleaned only when its sheet changed
+def _append_survey_rows(previous, revision, df_survey, df_sap):
+    new_rows = clean_survey_rows(df_survey.iloc[previous['raw_rows']:])
+    sap_changed = revision[2] != previous['revision'][2]
+    frames = {'survey': new_rows, 'sap': df_sap[SAP_COLUMNS]} if sap_changed else {'survey': new_rows}
+    normalized = normalize_frames(frames)
+    new_rows = score_survey(normalized['survey'])
+    df_sap_selected = add_tenure_category(normalized['sap']) if sap_changed else previous['df_sap_selected'].iloc[:0]
+
+    base_dtypes = categorical_dtypes(previous['df_survey'])
+    new_rows, df_sap_selected = optimize_dtypes(new_rows, df_sap_selected, base_dtypes)
+    dtypes = categorical_dtypes(new_rows)
+    if not sap_changed:
+        df_sap_selected = extend_categories(previous['df_sap_selected'], dtypes)
+    logger.info("finalize_data appended %d survey rows", len(new_rows))
+    return pd.concat([extend_categories(previous['df_survey'], dtypes), new_rows]), df_sap_selected
+
+# Keep the cleaned current wave in the partitioned store, so later waves can be compared
+# with it. A batch step (python survey_store.py), not part of finalize_data: serving
+# requests never rewrites the store and offline runs never replace the stored wave
+def store_wave(year=SURVEY_YEAR):
+    df_survey, _, _ = finalize_data()
+    with _last_finalized_lock:
+        df_sap_selected = _last_finalized['df_sap_selected']
+    return write_wave(year, df_survey.attrs['source_revision'], {'survey': df_survey, 'sap': df_sap_selected})
+
+# Waves in the store besides the one finalize_data serves
+def available_years():
+    return sorted(set(stored_years()) | {SURVEY_YEAR})
+
+# A stored wave shaped like finalize_data's output (df_survey, combined_df), reading
+# only the partitions of the given units (None: all)
+def load_wave(year, units=None):
+    info = wave_info(year)
+    if info is None:
+        raise ValueError(f"Survey wave {year} is not in the store")
+    return _load_wave(year, tuple(sorted(units)) if units is not None else None, info['revision'])
+
+@st.cache_resource(max_entries=8)
+def _load_wave(year, units, revision):
+    df_survey = read_waves('survey', [year], units)
+    df_sap_selected = read_waves('sap', [year], units)
     combined_df = pd.concat([df_survey, df_sap_selected], ignore_index=True)
+    # Unit slices get their own revision, as in _unit_partition
+    df_survey.attrs['source_revision'] = revision if units is None else f"{revision}/{','.join(units)}"
+    return df_survey, combined_df
+
+# Stage 1: credentials only, indexed by username (name, password, unit, email)
+@st.cache_resource(ttl=SNAPSHOT_TTL)
+def load_credentials():
+    df_creds = fetch_data_creds()
+    # A username entered twice in the sheet must not take the login page down; the
+    # lowest row wins
+    df_creds = df_creds.drop_duplicates('username', keep='last')
+    return df_creds.set_index('username')[['name', 'password', 'unit', 'email']].to_dict('index')
+
+# Data scope of a dashboard user, from the unit column of the credentials sheet:
+# None for 'ALL' (every unit), a list of units (comma separated in the sheet,
+# normalized like the survey, e.g. GOMED -> KG MEDIA) or [] for unknown users
+ALL_UNITS = 'ALL'
+
+def units_for(username):
+    user = load_credentials().get(username)
+    if user is None:
+        return []
+    units = [unit.strip() for unit in str(user['unit']).split(',') if unit.strip()]
+    if any(unit.upper() == ALL_UNITS for unit in units):
+        return None
+    unit_map = NORMALIZATION_SPEC['unit'].get('map', {})
+    return [unit_map.get(unit, unit) for unit in units]
+
+# finalize_data() limited to the units the user may see; each unit slice is cut once
+# per revision and shared read-only by every session of that unit
+def finalize_user_data(username):
+    df_survey, df_creds, combined_df = finalize_data()
+    units = units_for(username)
+    if units is None:
+        return df_survey, df_creds, combined_df
+    df_survey, combined_df = _unit_partition(df_survey.attrs['source_revision'], tuple(sorted(units)), df_survey, combined_df)
     return df_survey, df_creds, combined_df
+
+@st.cache_resource(max_entries=64)
+def _unit_partition(revision, units, _df_survey, _combined_df):
+    df_survey = _df_survey[_df_survey['unit'].isin(units)]
+    combined_df = _combined_df[_combined_df['unit'].isin(units)]
+    # Own revision, so per-frame stores (IPA cube files) are not shared across slices
+    df_survey.attrs['source_revision'] = f"{revision}/{','.join(units)}"
+    return df_survey, combined_df
+
+_prefetch_thread = None
+
+# Stage 2: after login, fetch and clean the survey/SAP data on a background thread so
+# the cache is warm by the time a page calls finalize_data()
+def prefetch_data():
+    global _prefetch_thread
+    if _prefetch_thread is not None and _prefetch_thread.is_alive():
+        return
+    _prefetch_thread = threading.Thread(target=finalize_data, name='prefetch-data', daemon=True)
+    add_script_run_ctx(_prefetch_thread)
+    _prefetch_thread.start()
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import streamlit as st
+import pandas as pd
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from snapshot import mixed_columns, numericise_column, sheet_slug
+
+_client = None
+_client_lock = threading.Lock()
+
+# One authorized gspread client for the whole process (loaders, access log)
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            secret_info = st.secrets["sheets"]
+            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(secret_info, scope)
+            _client = gspread.authorize(creds)
+        return _client
+
+# Local files hold what get_all_records() returned: every cell is numericised the way
+# gspread does it, so '#N/A' next to numbers comes back as the same mixed column
+def as_records(df):
+    text_columns = [column for column in df.columns if df[column].dtype == object]
+    restored = {column: numericise_column(df[column].fillna('').astype(str)) for column in text_columns}
+    return df.assign(**restored).infer_objects()
+
+def records_frame(header, values):
+    # Frame from raw cell values (as the Sheets API returns them), numericised like records
+    width = len(header)
+    rows = [(list(row) + [''] * width)[:width] for row in values]
+    return as_records(pd.DataFrame(rows, columns=header, dtype=object))
+
+# Data rows from position start_row on (0-based, header excluded); None when the sheet
+# now has fewer rows than that, i.e. rows were removed and only a full read is safe
+def rows_since(df, start_row):
+    if len(df) < start_row:
+        return None
+    return df.iloc[start_row:].reset_index(drop=True)
+
+def as_storable(df):
+    # Mixed number/text columns are stored as text (Arrow and CSV need one type)
+    return df.astype({column: str for column in mixed_columns(df)})
+
+# Sources read a sheet by its Sheets name into a DataFrame; 'remote' sources are
+# slow enough to be worth a local snapshot in front of them
+
+class SheetsSource:
+    remote = True
+
+    def __init__(self, client_factory=get_client):
+        self.client_factory = client_factory
+
+    def read(self, sheet_name):
+        return pd.DataFrame(self.client_factory().open(sheet_name).sheet1.get_all_records())
+
+    def read_since(self, sheet_name, start_row):
+        # Header, first column (to count rows) and the new rows only
+        sheet = self.client_factory().open(sheet_name).sheet1
+        header = (sheet.get_values('1:1') or [[]])[0]
+        n_rows = len(sheet.col_values(1)) - 1
+        if n_rows < start_row:
+            return None
+        values = sheet.get_values(f'{start_row + 2}:{n_rows + 1}') if n_rows > start_row else []
+        return records_frame(header, values)
+
+class CSVSource:
+    remote = False
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, sheet_name):
+        return self.directory / f'{sheet_slug(sheet_name)}.csv'
+
+    def read(self, sheet_name):
+        return as_records(pd.read_csv(self.path(sheet_name), dtype=str, keep_default_na=False))
+
+    def read_since(self, sheet_name, start_row):
+        return rows_since(self.read(sheet_name), start_row)
+
+    def write(self, sheet_name, df):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        df.to_csv(self.path(sheet_name), index=False)
+
+class ParquetSource:
+    remote = False
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, sheet_name):
+        return self.directory / f'{sheet_slug(sheet_name)}.parquet'
+
+    def read(self, sheet_name):
+        return as_records(pd.read_parquet(self.path(sheet_name)))
+
+    def read_since(self, sheet_name, start_row):
+        return rows_since(self.read(sheet_name), start_row)
+
+    def write(self, sheet_name, df):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        as_storable(df).to_parquet(self.path(sheet_name), index=False)
+
+class SQLiteSource:
+    remote = False
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def read(self, sheet_name):
+        with sqlite3.connect(self.path) as connection:
+            return as_records(pd.read_sql_query(f'SELECT * FROM "{sheet_slug(sheet_name)}"', connection))
+
+    def read_since(self, sheet_name, start_row):
+        # rowid follows insertion order, so only the new rows leave the database
+        with sqlite3.connect(self.path) as connection:
+            table = sheet_slug(sheet_name)
+            n_rows = connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            if n_rows < start_row:
+                return None
+            query = f'SELECT * FROM "{table}" ORDER BY rowid LIMIT -1 OFFSET ?'
+            return as_records(pd.read_sql_query(query, connection, params=(start_row,)))
+
+    def write(self, sheet_name, df):
+        with sqlite3.connect(self.path) as connection:
+            as_storable(df).to_sql(sheet_slug(sheet_name), connection, if_exists='replace', index=False)
+
+
+# In-process stand-in for the gspread client: open(name).sheet1 serves the rows of a
+# DataFrame through get_all_records() and takes append_rows(), with an optional
+# per-call latency to mimic the Google round trip in load tests
+class FakeWorksheet:
+    def __init__(self, header, rows, latency=0.0):
+        self.header = list(header)
+        self.rows = [list(row) for row in rows]
+        self.latency = latency
+        self.calls = 0
+
+    def get_all_records(self):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [dict(zip(self.header, row)) for row in self.rows]
+
+    def get_values(self, range_name):
+        # Whole-row ranges only ('1:1', '5:20'), 1-based with the header as row 1
+        self.calls += 1
+        time.sleep(self.latency)
+        first, last = (int(bound) for bound in range_name.split(':'))
+        table = [self.header] + self.rows
+        return [[str(value) for value in row] for row in table[first - 1:last]]
+
+    def col_values(self, col):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self.header[col - 1]] + [row[col - 1] for row in self.rows]
+
+    def append_rows(self, rows):
+        self.calls += 1
+        time.sleep(self.latency)
+        self.rows.extend(list(row) for row in rows)
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.sheet1 = worksheet
+
+class FakeSheetsClient:
+    def __init__(self, sheets=None, latency=0.0, seed=None):
+        self.latency = latency
+        self.seed = seed
+        self._spreadsheets = {}
+        self._lock = threading.Lock()
+        for name, df in (sheets or {}).items():
+            self.add_sheet(name, df)
+
+    def add_sheet(self, name, df):
+        rows = df.astype(object).to_numpy().tolist()
+        worksheet = FakeWorksheet(df.columns, rows, self.latency)
+        with self._lock:
+            self._spreadsheets[name] = FakeSpreadsheet(worksheet)
+        return worksheet
+
+    def open(self, name):
+        with self._lock:
+            spreadsheet = self._spreadsheets.get(name)
+        if spreadsheet is not None:
+            return spreadsheet
+        if self.seed is None:
+            raise gspread.SpreadsheetNotFound(name)
+        # Sheets not added explicitly are loaded once from the seed source
+        self.add_sheet(name, self.seed.read(name))
+        return self._spreadsheets[name]
+
+    def open_by_key(self, key):
+        with self._lock:
+            if key not in self._spreadsheets:
+                self._spreadsheets[key] = FakeSpreadsheet(FakeWorksheet([], [], self.latency))
+            return self._spreadsheets[key]
+
+
+# Source chosen by the optional [data_source] secrets section, overridable with the
+# SURVEY_DATA_SOURCE / SURVEY_DATA_PATH environment variables:
+# backend = "sheets" (default), "csv" / "parquet" (path = directory), "sqlite"
+# (path = database file) or "fake" (Sheets stand-in seeded from a Parquet directory)
+def data_source_config():
+    try:
+        config = dict(st.secrets.get('data_source', {}))
+    except FileNotFoundError:
+        config = {}
+    if os.environ.get('SURVEY_DATA_SOURCE'):
+        config['backend'] = os.environ['SURVEY_DATA_SOURCE']
+    if os.environ.get('SURVEY_DATA_PATH'):
+        config['path'] = os.environ['SURVEY_DATA_PATH']
+    return config
+
+def make_source(config):
+    backend = config.get('backend', 'sheets')
+    if backend == 'sheets':
+        return SheetsSource()
+    if backend == 'csv':
+        return CSVSource(config.get('path', 'data'))
+    if backend == 'parquet':
+        return ParquetSource(config.get('path', 'data'))
+    if backend == 'sqlite':
+        return SQLiteSource(config.get('path', 'survey.sqlite'))
+    if backend == 'fake':
+        client = FakeSheetsClient(latency=float(config.get('latency', 0.0)), seed=ParquetSource(config.get('path', 'data')))
+        return SheetsSource(client_factory=lambda: client)
+    raise ValueError(f"Unknown data source backend: {backend}")
+
+@st.cache_resource
+def get_source():
+    return make_source(data_source_config())
+
+
+if __name__ == '__main__':
+    # Export the configured source to local files for ops, e.g.
+    # python data_sources.py parquet data/  (then backend = "parquet", path = "data/")
+    import sys
+    from fetch_data import SURVEY_SHEET, CREDS_SHEET, SAP_SHEET
+
+    backend, path = sys.argv[1], sys.argv[2]
+    target = make_source({'backend': backend, 'path': path})
+    for sheet_name in [SURVEY_SHEET, CREDS_SHEET, SAP_SHEET]:
+        df = get_source().read(sheet_name)
+        target.write(sheet_name, df)
+        print(f"Exported {len(df)} rows of {sheet_name!r} to {backend}:{path}")
@@ -1,42 +1,84 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import toml
+from data_sources import get_client, get_source
+from snapshot import SNAPSHOT_TTL, load_snapshot, invalidate_snapshot, frame_revision
+from tracing import mark_miss, span
 
-# Fetch data
-@st.cache_resource()
+# Survey wave the dashboard serves: the response sheet and the prior-year
+# participation flag (participation_23 for 2024) follow SURVEY_YEAR
+SURVEY_YEAR = int(os.environ.get('SURVEY_YEAR', 2024))
+PRIOR_PARTICIPATION = f'participation_{(SURVEY_YEAR - 1) % 100:02d}'
+
+SURVEY_SHEET = os.environ.get('SURVEY_SHEET', f'Employee Survey {SURVEY_YEAR}')
+CREDS_SHEET = 'Dashboard Credentials'
+SAP_SHEET = 'Employee Not Done'
+
+# Sheets that only ever grow at the bottom (form responses): a refresh fetches just
+# the rows past the local snapshot. The SAP list shrinks as people respond, so it is
+# always read whole.
+APPEND_ONLY_SHEETS = [SURVEY_SHEET]
+
+# Download a whole sheet from the configured data source (Google Sheets by default)
+def download_sheet(sheet_name, source=None):
+    mark_miss()
+    return (source or get_source()).read(sheet_name)
+
+def download_rows_since(sheet_name, start_row, source=None):
+    mark_miss()
+    return (source or get_source()).read_since(sheet_name, start_row)
+
+def load_sheet(sheet_name, source=None):
+    # Local backends are already fast files, only remote ones go through a snapshot
+    source = source or get_source()
+    with span('load_sheet', cached=source.remote) as traced:
+        if source.remote:
+            fetch_since = None
+            if sheet_name in APPEND_ONLY_SHEETS:
+                fetch_since = lambda start_row: download_rows_since(sheet_name, start_row, source)
+            df = load_snapshot(sheet_name, lambda: download_sheet(sheet_name, source), fetch_since=fetch_since)
+        else:
+            df = source.read(sheet_name)
+            df.attrs['revision'] = frame_revision(df)
+        traced.rows = len(df)
+    return df
+
+# Fetch data (local snapshot first, Sheets only when the snapshot is stale)
+@st.cache_resource(ttl=SNAPSHOT_TTL)
 def fetch_data_survey():
-    secret_info = st.secrets["sheets"]
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(secret_info, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open('Employee Survey 2024')
-    sheet = spreadsheet.sheet1
-    data = sheet.get_all_records()
-    df_survey = pd.DataFrame(data)
+    df_survey = load_sheet(SURVEY_SHEET)
     return df_survey
 
-@st.cache_resource()
+@st.cache_resource(ttl=SNAPSHOT_TTL)
 def fetch_data_creds():
-    secret_info = st.secrets["sheets"]
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(secret_info, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open('Dashboard Credentials')
-    sheet = spreadsheet.sheet1
-    data = sheet.get_all_records()
-    df_creds = pd.DataFrame(data)
+    df_creds = load_sheet(CREDS_SHEET)
     return df_creds
 
-@st.cache_resource()
+@st.cache_resource(ttl=SNAPSHOT_TTL)
 def fetch_data_sap():
-    secret_info = st.secrets["sheets"]
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(secret_info, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open('Employee Not Done')
-    sheet = spreadsheet.sheet1
-    data = sheet.get_all_records()
-    df_sap = pd.DataFrame(data)
+    df_sap = load_sheet(SAP_SHEET)
     return df_sap
+
+# Fetch the three sheets in parallel, so a cold load costs the slowest sheet only
+@st.cache_resource(ttl=SNAPSHOT_TTL)
+def fetch_all_data():
+    mark_miss()
+    # The source is resolved here: the pool threads have no Streamlit script context
+    source = get_source()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        df_survey, df_creds, df_sap = pool.map(lambda name: load_sheet(name, source), [SURVEY_SHEET, CREDS_SHEET, SAP_SHEET])
+    return df_survey, df_creds, df_sap
+
+# Fingerprint of the raw inputs, taken from the snapshot revisions
+def data_revision(*frames):
+    return tuple(df.attrs.get('revision') or frame_revision(df) for df in frames)
+
+# Force the next load to go back to Google Sheets
+def invalidate_data(sheet_name=None):
+    invalidate_snapshot(sheet_name)
+    fetch_data_survey.clear()
+    fetch_data_creds.clear()
+    fetch_data_sap.clear()
+    fetch_all_data.clear()
@@ -0,0 +1,151 @@
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Confidentiality rule: slices with fewer rows than this are never shown
+MIN_GROUP_SIZE = 2
+
+# Number of set bits in every byte value, for counting rows in a packed bitmap
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint32)
+
+# Inverted index over the filterable columns: every value maps to a packed row
+# bitmap, so a filter combination is a handful of byte-wise AND/OR operations
+class FilterIndex:
+    def __init__(self, df, columns):
+        self.n_rows = len(df)
+        self.n_bytes = (self.n_rows + 7) // 8
+        self.values = {}
+        self.bitmaps = {}
+        self.codes = {}
+        rows = np.arange(self.n_rows)
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[column])
+            present = codes >= 0
+            matrix = np.zeros((len(uniques), self.n_bytes), dtype=np.uint8)
+            np.bitwise_or.at(
+                matrix,
+                (codes[present], rows[present] >> 3),
+                (0x80 >> (rows[present] & 7)).astype(np.uint8),
+            )
+            self.values[column] = {value: position for position, value in enumerate(uniques)}
+            self.bitmaps[column] = matrix
+            # Value codes shifted by one (0 = missing), for counting the values of a row set
+            self.codes[column] = (codes + 1).astype(np.uint16 if len(uniques) < 2**16 - 1 else np.uint32)
+
+    def all_rows(self):
+        bitmap = np.full(self.n_bytes, 0xFF, dtype=np.uint8)
+        if self.n_rows % 8:
+            bitmap[-1] = (0xFF << (8 - self.n_rows % 8)) & 0xFF
+        return bitmap
+
+    def bitmap(self, column, selected):
+        # OR of the bitmaps of the selected values of one column
+        positions = [self.values[column][value] for value in selected if value in self.values[column]]
+        if not positions:
+            return np.zeros(self.n_bytes, dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bitmaps[column][positions], axis=0)
+
+    def mask(self, selections):
+        # AND across columns of the per-column ORs; empty selections are ignored
+        bitmap = self.all_rows()
+        for column, selected in selections.items():
+            if selected:
+                bitmap &= self.bitmap(column, selected)
+        return bitmap
+
+    def count(self, bitmap):
+        return int(_POPCOUNT[bitmap].sum())
+
+    def options(self, column, bitmap):
+        # Values of `column` still present under `bitmap`, with their row counts: one
+        # bincount over the codes of the rows instead of ANDing every value's bitmap
+        codes = self.codes[column][self.positions(bitmap)]
+        counts = np.bincount(codes, minlength=len(self.values[column]) + 1)[1:]
+        return {value: int(counts[position]) for value, position in self.values[column].items() if counts[position]}
+
+    def positions(self, bitmap):
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
+
+
+# Rows of a shared frame by position, without copying it: filters narrow the position
+# array, and consumers take only the columns they need (project) or the whole slice
+# for display (to_frame). The base frame is never modified.
+class FrameView:
+    def __init__(self, df, positions):
+        self.df = df
+        self.positions = np.asarray(positions, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def empty(self):
+        return len(self.positions) == 0
+
+    def column(self, name):
+        return self.df[name].iloc[self.positions]
+
+    def where(self, column, value):
+        # Rows whose `column` equals `value`, gathered from that one column only
+        keep = self.df[column].to_numpy()[self.positions] == value
+        return FrameView(self.df, self.positions[keep])
+
+    def project(self, columns):
+        return self.df.iloc[self.positions, self.df.columns.get_indexer(list(columns))]
+
+    def to_frame(self):
+        return self.df.iloc[self.positions]
+
+
+# Bounded process-wide LRU shared by every session, with hit/miss counters
+class LRUCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else None}
+
+
+_frame_cache = {}
+
+# Per-frame memo: the cached frames from finalize_data are shared, so structures
+# derived from them are built once and dropped when the frame is garbage collected
+def cached_for_frame(df, key, build):
+    key = (id(df), key)
+    entry = _frame_cache.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    value = build()
+    _frame_cache[key] = (weakref.ref(df, lambda _, key=key: _frame_cache.pop(key, None)), value)
+    return value
+
+def get_filter_index(df, columns):
+    return cached_for_frame(df, ('filter_index', tuple(columns)), lambda: FilterIndex(df, columns))
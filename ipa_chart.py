@@ -0,0 +1,65 @@
+import hashlib
+import io
+import pandas as pd
+from filter_index import LRUCache
+from lazy_imports import lazy_import
+from tracing import register_cache, span
+
+# Figure objects are created without pyplot, so nothing accumulates in its global registry
+figure = lazy_import('matplotlib.figure')
+ticker = lazy_import('matplotlib.ticker')
+
+def draw_ipa_scatter(correlation_df, importance_midpoint, performance_midpoint):
+    fig = figure.Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    # Scatter plot points with color map
+    ax.scatter(correlation_df['Performance'], correlation_df['Importance'],
+               c=correlation_df['Category'].astype('category').cat.codes,
+               cmap='viridis', s=100, alpha=0.7)
+
+    # Label each factor with better placement
+    for performance, importance, factor in zip(correlation_df['Performance'], correlation_df['Importance'], correlation_df['Factor']):
+        ax.text(performance + 0.01, importance, factor, fontsize=9, ha='left', va='bottom')
+
+    # Add dynamic quadrant lines
+    ax.axhline(y=importance_midpoint, color='green', linestyle='--', label="Importance Midpoint")
+    ax.axvline(x=performance_midpoint, color='red', linestyle='--', label="Performance Midpoint")
+
+    # Set axis labels and title
+    ax.set_xlabel('Performance (Mean of SAT)', fontsize=12, labelpad=10)
+    ax.set_ylabel('Importance (Standardized Beta)', fontsize=12, labelpad=10)
+    ax.set_title('Importance-Performance Analysis', fontsize=16, pad=20)
+
+    # Add grid lines and adjust legend
+    ax.grid(True, linestyle='--', alpha=0.5)
+    ax.legend(loc='lower right', bbox_to_anchor=(1, 0), fontsize=10, markerscale=1.5)
+
+    # Format tick labels to 2 decimal places
+    ax.xaxis.set_major_formatter(ticker.FormatStrFormatter('%.2f'))
+    ax.yaxis.set_major_formatter(ticker.FormatStrFormatter('%.2f'))
+    return fig
+
+
+# Process-wide LRU of rendered chart bytes, keyed by a hash of the IPA table
+figure_cache = register_cache('ipa_chart', LRUCache(max_entries=256))
+
+def chart_key(correlation_df, *extra):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(correlation_df, index=False).to_numpy().tobytes())
+    digest.update(repr(extra).encode())
+    return digest.hexdigest()
+
+# PNG/SVG bytes of the IPA scatter plot; unchanged tables skip Matplotlib entirely
+def render_ipa_chart(correlation_df, importance_midpoint, performance_midpoint, fmt='png', dpi=200):
+    with span('render_ipa_chart', rows=len(correlation_df), cached=True) as traced:
+        key = chart_key(correlation_df, importance_midpoint, performance_midpoint, fmt, dpi)
+        data = figure_cache.get(key)
+        if data is None:
+            traced.miss()
+            fig = draw_ipa_scatter(correlation_df, importance_midpoint, performance_midpoint)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+            fig.clear()
+            data = buffer.getvalue()
+            figure_cache.put(key, data)
+    return data
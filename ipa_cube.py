@@ -0,0 +1,128 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from filter_index import MIN_GROUP_SIZE, cached_for_frame
+from ipa_engine import classify_factors, get_ipa_cells, standardized_betas
+from snapshot import SNAPSHOT_DIR, frame_revision, write_table_atomic
+
+# Two-way slices managers look at most, precomputed next to every single column
+IPA_CUBE_PAIRS = [
+    ('unit', 'subunit'), ('unit', 'division'), ('unit', 'layer'), ('unit', 'generation'),
+    ('subunit', 'layer'), ('subunit', 'generation'), ('division', 'layer'),
+]
+
+CUBE_KEYS = ['column_1', 'value_1', 'column_2', 'value_2']
+
+# IPA rows for a stack of Gram matrices, one group per key row; groups under the
+# confidentiality threshold are left out
+def _cube_rows(factors, keys, grams, columns):
+    n = grams[:, 0, 0]
+    keep = n >= MIN_GROUP_SIZE
+    keys, grams, n = keys[keep].reset_index(drop=True), grams[keep], n[keep]
+    if not len(n):
+        return None
+
+    importance = np.round(standardized_betas(grams), 3)
+    performance = np.round(grams[:, 0, 1:-1] / n[:, None], 3)
+    importance_midpoint = (importance.max(axis=1) + importance.min(axis=1)) / 2
+    performance_midpoint = (performance.max(axis=1) + performance.min(axis=1)) / 2
+    category = classify_factors(importance, performance, importance_midpoint[:, None], performance_midpoint[:, None])
+
+    repeat = len(factors)
+    rows = {}
+    for position, key in enumerate(['1', '2']):
+        column = columns[position] if position < len(columns) else ''
+        values = keys[column].astype(str).to_numpy() if column else np.full(len(n), '')
+        rows[f'column_{key}'] = column
+        rows[f'value_{key}'] = np.repeat(values, repeat)
+    rows['n'] = np.repeat(n.astype(int), repeat)
+    rows['Factor'] = np.tile(factors, len(n))
+    rows['Importance'] = importance.ravel()
+    rows['Performance'] = performance.ravel()
+    rows['Category'] = category.ravel()
+    return pd.DataFrame(rows)
+
+# Batch precomputation: the IPA table for the whole population, for every value of
+# every column and for every observed combination of the IPA_CUBE_PAIRS
+def build_ipa_cube(cells, columns, pairs=IPA_CUBE_PAIRS):
+    total = cells.unpack(cells.cells.sum(axis=0))[None]
+    parts = [_cube_rows(cells.independent_vars, pd.DataFrame(index=[0]), total, ())]
+    groupings = [(column,) for column in columns] + [pair for pair in pairs if set(pair) <= set(columns)]
+    for grouping in groupings:
+        if not set(grouping) <= set(cells.keys.columns):
+            continue
+        keys, grams = cells.group_grams(list(grouping))
+        parts.append(_cube_rows(cells.independent_vars, keys, grams, grouping))
+    cube = pd.concat([part for part in parts if part is not None], ignore_index=True)
+    return cube.astype({column: 'category' for column in CUBE_KEYS + ['Factor', 'Category']})
+
+# Precomputed results with a lookup table from slice key to row positions
+class IPACube:
+    def __init__(self, table):
+        self.table = table
+        self.groups = table.groupby(CUBE_KEYS, observed=True, sort=False).indices
+
+    def lookup(self, selections):
+        # Overall, single-value and precomputed two-way slices; None means compute live
+        active = {column: values for column, values in selections.items() if values}
+        if len(active) > 2 or any(len(values) != 1 for values in active.values()):
+            return None
+        keys = [(column, str(values[0])) for column, values in active.items()]
+        candidates = [keys, keys[::-1]] if len(keys) == 2 else [keys]
+        for candidate in candidates:
+            candidate = candidate + [('', '')] * (2 - len(candidate))
+            positions = self.groups.get((candidate[0][0], candidate[0][1], candidate[1][0], candidate[1][1]))
+            if positions is not None:
+                correlation_df = self.table.iloc[positions][['Factor', 'Importance', 'Performance', 'Category']]
+                return correlation_df.astype({'Factor': str, 'Category': str}).reset_index(drop=True)
+        return None
+
+
+# One file per scope (columns, pairs and the units in the frame, i.e. the unit slice of
+# a scoped user); the revision is in the file name, so a new revision writes a new file
+# and replaces the older one of its scope
+def ipa_cube_path(df, columns, pairs=IPA_CUBE_PAIRS):
+    revision = df.attrs.get('source_revision') or frame_revision(df)
+    units = sorted(map(str, df['unit'].unique())) if 'unit' in df.columns else []
+    scope = hashlib.sha1(repr((units, list(columns), list(pairs))).encode()).hexdigest()[:12]
+    key = hashlib.sha1(repr((revision, len(df))).encode()).hexdigest()[:12]
+    return SNAPSHOT_DIR / f'ipa_cube_{scope}_{key}.parquet'
+
+def write_ipa_cube(cube, path):
+    write_table_atomic(pa.Table.from_pandas(cube, preserve_index=False), path)
+    scope = path.stem.rsplit('_', 1)[0]
+    for old_path in path.parent.glob(f'{scope}_*.parquet'):
+        if old_path != path:
+            old_path.unlink(missing_ok=True)
+
+# Load the stored cube for this frame at startup, building and storing it if missing
+def load_ipa_cube(df, columns, pairs=IPA_CUBE_PAIRS):
+    path = ipa_cube_path(df, columns, pairs)
+    try:
+        cube = pq.read_table(path).to_pandas()
+    except FileNotFoundError:
+        cube = build_ipa_cube(get_ipa_cells(df, columns), columns, pairs)
+        write_ipa_cube(cube, path)
+    return IPACube(cube)
+
+def get_ipa_cube(df, columns, pairs=IPA_CUBE_PAIRS):
+    return cached_for_frame(df, ('ipa_cube', tuple(columns), tuple(pairs)), lambda: load_ipa_cube(df, columns, pairs))
+
+
+if __name__ == '__main__':
+    # Batch stage: python ipa_cube.py, e.g. right after the sheets are refreshed
+    from data_processing import finalize_data
+    from fetch_data import PRIOR_PARTICIPATION
+
+    columns_list = [
+        'unit', 'subunit', 'directorate', 'division', 'department', 'section',
+        'layer', 'status', 'generation', 'gender', 'marital', 'education',
+        'tenure_category', 'children', 'region', PRIOR_PARTICIPATION
+    ]
+    df_survey, _, _ = finalize_data()
+    cube = build_ipa_cube(get_ipa_cells(df_survey, columns_list), columns_list)
+    path = ipa_cube_path(df_survey, columns_list)
+    write_ipa_cube(cube, path)
+    print(f"Wrote {len(cube)} IPA rows to {path}")
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from filter_index import FilterIndex, cached_for_frame
+from survey_schema import DRIVERS, OUTCOME
+
+# Drivers (X) and outcome (y) of the Importance-Performance Analysis
+INDEPENDENT_VARS = DRIVERS
+IPA_COLUMNS = INDEPENDENT_VARS + [OUTCOME]
+
+IPA_CATEGORIES = [
+    'High Importance, High Performance (Keep doing well)',
+    'High Importance, Low Performance (Improve performance)',
+    'Low Importance, High Performance (Possible overkill)',
+    'Low Importance, Low Performance (Low priority)',
+]
+
+# Sufficient statistics are the Gram matrix of [1, X, y]: G[0, 0] is the row count,
+# G[0, 1:] the column sums and G[1:, 1:] the cross-products. Gram matrices of
+# disjoint row sets add up, so any slice is the sum of its parts.
+def _design(df, columns):
+    values = df[columns].to_numpy(dtype=float, na_value=np.nan)
+    values = values[~np.isnan(values).any(axis=1)]  # listwise deletion, like the regression
+    return np.hstack([np.ones((len(values), 1)), values])
+
+# Symmetric Gram matrices are stored as their upper triangle; unpack works on stacks
+def unpack_gram(flat, size):
+    upper = np.triu_indices(size)
+    gram = np.zeros(flat.shape[:-1] + (size, size))
+    gram[..., upper[0], upper[1]] = flat
+    return gram + np.swapaxes(np.triu(gram, 1), -1, -2)
+
+def sufficient_stats(df, independent_vars=INDEPENDENT_VARS, outcome=OUTCOME):
+    design = _design(df, list(independent_vars) + [outcome])
+    return design.T @ design
+
+# Standardized betas in closed form: solve R_xx b = r_xy on the correlation matrix.
+# Zero-variance columns get scale 1 (as StandardScaler does) and the pseudo-inverse
+# gives the minimum-norm solution for collinear drivers, as lstsq would.
+# Works on one Gram matrix or a stack of them (..., p, p).
+def standardized_betas(gram):
+    gram = np.asarray(gram, dtype=float)
+    n = gram[..., 0, 0]
+    sums = gram[..., 0, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centered = gram[..., 1:, 1:] - sums[..., :, None] * sums[..., None, :] / n[..., None, None]
+        scale = np.sqrt(np.clip(np.diagonal(centered, axis1=-2, axis2=-1), 0, None))
+        scale = np.where(scale == 0, 1, scale)
+        corr = centered / (scale[..., :, None] * scale[..., None, :])
+        corr = np.where(np.isfinite(corr), corr, 0)
+    betas = (np.linalg.pinv(corr[..., :-1, :-1]) @ corr[..., :-1, -1:])[..., 0]
+    return np.where((n >= 2)[..., None], betas, np.nan)
+
+# Quadrant of each factor relative to the midpoints of the importance/performance ranges,
+# as an index into IPA_CATEGORIES
+def quadrant_codes(importance, performance, importance_midpoint, performance_midpoint):
+    high_importance = np.asarray(importance) > np.asarray(importance_midpoint)
+    high_performance = np.asarray(performance) > np.asarray(performance_midpoint)
+    return np.select([high_importance & high_performance, high_importance, high_performance], [0, 1, 2], default=3)
+
+def classify_factors(importance, performance, importance_midpoint, performance_midpoint):
+    return np.asarray(IPA_CATEGORIES)[quadrant_codes(importance, performance, importance_midpoint, performance_midpoint)]
+
+def ipa_midpoints(correlation_df):
+    importance_midpoint = (correlation_df['Importance'].max() + correlation_df['Importance'].min()) / 2
+    performance_midpoint = (correlation_df['Performance'].max() + correlation_df['Performance'].min()) / 2
+    return importance_midpoint, performance_midpoint
+
+# IPA table (Factor, Importance, Performance, Category) from sufficient statistics
+def ipa_table(gram, independent_vars=INDEPENDENT_VARS):
+    betas = standardized_betas(gram)
+    means = gram[0, 1:-1] / gram[0, 0] if gram[0, 0] else np.full(len(betas), np.nan)
+    correlation_df = pd.DataFrame({
+        'Factor': list(independent_vars),
+        'Importance': np.round(betas, 3),  # Standardized beta as importance
+        'Performance': np.round(means, 3),  # Item mean as performance
+    })
+    correlation_df['Category'] = classify_factors(
+        correlation_df['Importance'], correlation_df['Performance'], *ipa_midpoints(correlation_df)
+    )
+    return correlation_df
+
+
+# Resample x row cells per bootstrap batch: the draws, the weights and their float copy
+# take 24 bytes a cell, so about 48 MB whatever the slice size
+BOOTSTRAP_BATCH_CELLS = 2_000_000
+
+# Bootstrap of the IPA table: resamples are drawn as multinomial row weights, so the
+# Gram matrices of a whole batch of resamples are one (B x n) @ (n x p(p+1)/2) product
+# and the betas of the batch one stacked pseudo-inverse
+def bootstrap_ipa(df, n_resamples=2000, confidence=0.95, seed=0,
+                  independent_vars=INDEPENDENT_VARS, outcome=OUTCOME, batch_size=None):
+    design = _design(df, list(independent_vars) + [outcome])
+    n_rows, size = design.shape
+    batch_size = batch_size or max(1, BOOTSTRAP_BATCH_CELLS // max(n_rows, 1))
+    # Upper-triangle products of every row, filled one column block at a time (in the
+    # np.triu_indices order unpack_gram expects) to avoid full-size temporaries
+    outer = np.empty((n_rows, size * (size + 1) // 2))
+    start = 0
+    for column in range(size):
+        outer[:, start:start + size - column] = design[:, column:column + 1] * design[:, column:]
+        start += size - column
+    rng = np.random.default_rng(seed)
+
+    importance, performance = [], []
+    for start in range(0, n_resamples, batch_size):
+        batch = min(batch_size, n_resamples - start)
+        draws = rng.integers(0, n_rows, size=(batch, n_rows))
+        draws += np.arange(batch)[:, None] * n_rows
+        weights = np.bincount(draws.ravel(), minlength=batch * n_rows).reshape(batch, n_rows)
+        grams = unpack_gram(weights @ outer, size)
+        importance.append(standardized_betas(grams))
+        performance.append(grams[:, 0, 1:-1] / n_rows)
+    importance = np.vstack(importance)
+    performance = np.vstack(performance)
+
+    importance_midpoint = (importance.max(axis=1) + importance.min(axis=1)) / 2
+    performance_midpoint = (performance.max(axis=1) + performance.min(axis=1)) / 2
+    codes = quadrant_codes(importance, performance, importance_midpoint[:, None], performance_midpoint[:, None])
+
+    tail = (1 - confidence) / 2 * 100
+    bootstrap_df = pd.DataFrame({
+        'Factor': list(independent_vars),
+        'Importance Low': np.round(np.nanpercentile(importance, tail, axis=0), 3),
+        'Importance High': np.round(np.nanpercentile(importance, 100 - tail, axis=0), 3),
+        'Performance Low': np.round(np.percentile(performance, tail, axis=0), 3),
+        'Performance High': np.round(np.percentile(performance, 100 - tail, axis=0), 3),
+    })
+    # Share of resamples in which each factor lands in each quadrant
+    for code, category in enumerate(IPA_CATEGORIES):
+        bootstrap_df[category] = np.round((codes == code).mean(axis=0), 3)
+    return bootstrap_df
+
+
+# Per-cell sufficient statistics: respondents are grouped by every filterable column
+# and only the summed Gram matrix of each cell is kept, so a filter selection is
+# answered by summing the matching cells instead of touching the raw rows
+class IPACells:
+    def __init__(self, df, by, independent_vars=INDEPENDENT_VARS, outcome=OUTCOME, chunk_size=8192):
+        self.independent_vars = list(independent_vars)
+        columns = self.independent_vars + [outcome]
+        by = [column for column in by if column in df.columns]
+
+        complete = df[columns].notna().all(axis=1).to_numpy()
+        keys = df.loc[complete, by]
+        codes = keys.groupby(by, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        n_cells = codes.max() + 1 if len(codes) else 0
+        design = _design(df.loc[complete], columns)
+
+        # Only the upper triangle of each symmetric Gram matrix is stored
+        size = design.shape[1]
+        self._upper = np.triu_indices(size)
+        self.size = size
+        self.cells = np.zeros((n_cells, len(self._upper[0])))
+        for start in range(0, len(design), chunk_size):
+            block = design[start:start + chunk_size]
+            outer = block[:, self._upper[0]] * block[:, self._upper[1]]
+            np.add.at(self.cells, codes[start:start + chunk_size], outer)
+
+        first_rows = np.unique(codes, return_index=True)[1]
+        self.keys = keys.iloc[first_rows].reset_index(drop=True)
+        self.index = FilterIndex(self.keys, by)
+
+    def unpack(self, flat):
+        return unpack_gram(flat, self.size)
+
+    def gram(self, selections):
+        positions = self.index.positions(self.index.mask(selections))
+        return self.unpack(self.cells[positions].sum(axis=0))
+
+    def group_grams(self, columns):
+        # Gram matrix of every observed value combination of `columns`
+        sums = pd.DataFrame(self.cells).groupby([self.keys[column] for column in columns], observed=True).sum()
+        return sums.index.to_frame(index=False), self.unpack(sums.to_numpy())
+
+    def ipa_table(self, selections):
+        return ipa_table(self.gram(selections), self.independent_vars)
+
+def get_ipa_cells(df, by):
+    return cached_for_frame(df, ('ipa_cells', tuple(by)), lambda: IPACells(df, by))
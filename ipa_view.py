@@ -0,0 +1,83 @@
+import hashlib
+import os
+import streamlit as st
+from filter_index import MIN_GROUP_SIZE, LRUCache, cached_for_frame
+from ipa_chart import render_ipa_chart
+from ipa_cube import get_ipa_cube
+from ipa_engine import IPA_COLUMNS, bootstrap_ipa, get_ipa_cells, ipa_midpoints, ipa_table, sufficient_stats
+from snapshot import frame_revision
+from tracing import register_cache, span
+
+# IPA results (tables and bootstrap intervals) for every session of the process,
+# keyed by the fingerprint of the row set they were computed from
+IPA_CACHE_ENTRIES = int(os.environ.get('SURVEY_IPA_CACHE_ENTRIES', 1024))
+
+ipa_cache = register_cache('ipa_results', LRUCache(max_entries=IPA_CACHE_ENTRIES))
+
+def frame_fingerprint(df):
+    # Cleaned frames carry their source revision; anything else is hashed once
+    return cached_for_frame(df, 'fingerprint', lambda: df.attrs.get('source_revision') or frame_revision(df))
+
+# Same rows of the same data and the same variables give the same key, whichever
+# page, session or filter path selected them
+def row_set_key(view, variables, kind='ipa_table'):
+    digest = hashlib.sha1(repr((kind, frame_fingerprint(view.df), len(view.df), list(variables))).encode())
+    digest.update(view.positions.tobytes())
+    return digest.hexdigest()
+
+def compute_ipa_table(view, selections=None, columns=None):
+    if selections is not None:
+        # Filter selections over `columns`: precomputed IPA cube, else the per-cell
+        # sufficient statistics of the slice
+        correlation_df = get_ipa_cube(view.df, columns).lookup(selections)
+        if correlation_df is None:
+            correlation_df = get_ipa_cells(view.df, columns).ipa_table(selections)
+        return correlation_df
+    # Any other row set: closed form from the sufficient statistics of its rows
+    return ipa_table(sufficient_stats(view.project(IPA_COLUMNS)))
+
+def cached_ipa(kind, view, compute, variables=IPA_COLUMNS):
+    with span(kind, rows=len(view), cached=True) as traced:
+        key = row_set_key(view, variables, kind)
+        result = ipa_cache.get(key)
+        if result is None:
+            traced.miss()
+            result = compute()
+            ipa_cache.put(key, result)
+    return result
+
+# IPA table of the rows of a FrameView; selections/columns let make_filter's slices
+# use the IPA cube when the result is not cached yet
+def ipa_result(view, selections=None, columns=None):
+    return cached_ipa('ipa_table', view, lambda: compute_ipa_table(view, selections, columns))
+
+def bootstrap_result(view):
+    return cached_ipa('bootstrap_ipa', view, lambda: bootstrap_ipa(view.project(IPA_COLUMNS)))
+
+# The IPA block of the pages: table, bootstrap intervals, scatter plot and the
+# factors of each quadrant
+def render_ipa(view, selections=None, columns=None):
+    if len(view) < MIN_GROUP_SIZE:
+        st.write("Data is unavailable to protect confidentiality.")
+        return
+    correlation_df = ipa_result(view, selections, columns)
+
+    # Midpoint thresholds for dynamic quadrants
+    importance_midpoint, performance_midpoint = ipa_midpoints(correlation_df)
+
+    st.dataframe(correlation_df)
+
+    # Bootstrap intervals: small slices can move factors between quadrants on noise alone
+    if st.toggle("Show bootstrap confidence intervals", key='ipa_bootstrap'):
+        st.write("95% intervals over 2,000 resamples, and the share of resamples placing each factor in each quadrant:")
+        st.dataframe(bootstrap_result(view))
+
+    # Scatter plot for Importance-Performance Analysis (rendered once per distinct table)
+    st.image(render_ipa_chart(correlation_df, importance_midpoint, performance_midpoint))
+
+    # Classification of Independent Variables
+    st.write("Classification of Independent Variables:")
+    for category in correlation_df['Category'].unique():
+        with st.expander(f"{category}"):
+            factors_in_category = correlation_df[correlation_df['Category'] == category]['Factor']
+            st.write(", ".join(factors_in_category))
@@ -0,0 +1,68 @@
+import importlib
+import json
+import subprocess
+import sys
+import threading
+import time
+import types
+
+# Seconds spent importing each lazily loaded module, in load order
+IMPORT_TIMES = {}
+
+_import_lock = threading.Lock()
+
+# Stand-in for a module that is imported on first attribute access, so plotting
+# stacks only load when a chart is actually drawn
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        with _import_lock:
+            if self._module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(self.__name__)
+                IMPORT_TIMES.setdefault(self.__name__, time.perf_counter() - start)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+def import_report():
+    # Lazily loaded modules of this process, slowest first
+    return sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True)
+
+
+# Cold import cost of the stacks the dashboard uses, each measured in a fresh interpreter
+STARTUP_MODULES = [
+    'numpy', 'pandas', 'pyarrow', 'streamlit', 'gspread', 'oauth2client.service_account',
+    'streamlit_authenticator', 'matplotlib.pyplot', 'plotly.express',
+    'snapshot', 'fetch_data', 'data_processing', 'navigation', 'filter_index', 'ipa_engine', 'ipa_cube',
+]
+
+def measure_import(name):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {name}; print(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def startup_report(modules=STARTUP_MODULES):
+    return {name: measure_import(name) for name in modules}
+
+
+if __name__ == '__main__':
+    # python lazy_imports.py > import_times.json, then diff against an earlier run
+    print(json.dumps(startup_report(sys.argv[1:] or STARTUP_MODULES), indent=2))
@@ -2,7 +2,10 @@ import streamlit as st
 from time import sleep
 from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit.source_util import get_pages
-import pandas as pd
+from data_processing import available_years
+from fetch_data import SURVEY_YEAR
+from filter_index import MIN_GROUP_SIZE, FrameView, get_filter_index
+from tracing import begin_rerun, is_admin
 
 
 def get_current_page_name():
@@ -16,14 +19,18 @@ def get_current_page_name():
 
 
 def make_sidebar():
+    # Every page calls this first, so it also marks the start of a rerun for tracing
+    begin_rerun()
     with st.sidebar:
-        st.title(":blue_heart: KG Survey Result 2024")
+        st.title(f":blue_heart: KG Survey Result {SURVEY_YEAR}")
         st.write("")
         st.write("")
 
         if st.session_state.get("logged_in", False):
             st.page_link("pages/ipa.py", label="IPA", icon="🚝")
             st.page_link("pages/ipaxcat.py", label="IPA x Cat", icon="🗿")
+            if is_admin(st.session_state.get("username")):
+                st.page_link("pages/metrics.py", label="Metrics", icon="⏱️")
 
             st.write("")
             st.write("")
@@ -43,6 +50,13 @@ def logout():
     sleep(0.5)
     st.switch_page("streamlit_app.py")
 
+# Survey wave picker, shown once the store holds more than one wave
+def select_wave():
+    years = available_years()
+    if len(years) < 2:
+        return SURVEY_YEAR
+    return st.selectbox('Survey wave:', options=years[::-1], key='survey_wave')
+
 def make_filter(columns_list, df_survey):
     # Allow the user to select multiple filter columns (unit, subunit, etc.)
     filter_columns = st.multiselect(
@@ -67,31 +81,45 @@ def make_filter(columns_list, df_survey):
         - **Group 5 Str Layer 1** = CEO / Director / Vice Director / Deputy Director / Vice President / Assistant Vice President / Rector
         """)
 
-    # Initialize the filtered data as the original DataFrame
-    filtered_data = df_survey.copy()
+    # Start from every row of the prebuilt bitmap index instead of copying the frame
+    index = get_filter_index(df_survey, columns_list)
+    bitmap = index.all_rows()
 
     # List to store selected filter values for display in the subheader
     selected_filters = []
+    # Column -> selected values, for consumers that work from the index (IPA cells)
+    selections = {}
 
     # Display filter options for each selected filter column
     for filter_col in filter_columns:
+        # Options cascade from the filters above. The labels stay the raw values: the
+        # widget ID is built from them, so counts in the labels would clear every
+        # selection below a changed filter; the row counts go in a caption instead
+        counts = index.options(filter_col, bitmap)
         selected_filter_value = st.multiselect(
             f'Select {filter_col.capitalize()} to filter the data:',
-            options=filtered_data[filter_col].unique(),
+            options=list(counts),
             key=f'filter_{filter_col}'  # Unique key for each filter selectbox
         )
+        if selected_filter_value:
+            st.caption(', '.join(f"{value}: {counts.get(value, 0)} rows" for value in selected_filter_value))
+        else:
+            st.caption(f"{len(counts)} values, {sum(counts.values())} rows")
         
         # Check if any values are selected for this filter
         if selected_filter_value:
-            # Filter the data to include only rows where the column value is in the selected values
-            filtered_data = filtered_data[filtered_data[filter_col].isin(selected_filter_value)]
+            # Keep only rows where the column value is in the selected values
+            bitmap = bitmap & index.bitmap(filter_col, selected_filter_value)
+            selections[filter_col] = selected_filter_value
             
             # Add the selected filter values to the list for subheader display
-            selected_filters.append(f"{filter_col.capitalize()}: {', '.join(selected_filter_value)}")
+            selected_filters.append(f"{filter_col.capitalize()}: {', '.join(map(str, selected_filter_value))}")
 
-    # Confidentiality check: return empty DataFrame if filtered data has only 1 record
-    if filtered_data.shape[0] <= 1:
+    # Confidentiality check: return an empty view if filtered data has only 1 record
+    rows = index.positions(bitmap)
+    if len(rows) < MIN_GROUP_SIZE:
         st.write("Data is unavailable to protect confidentiality.")
-        return pd.DataFrame(), selected_filters  # Return an empty DataFrame and the selected filters
+        return FrameView(df_survey, []), selected_filters, selections  # Return an empty view and the selected filters
     
-    return filtered_data, selected_filters
+    # Row positions into the shared frame; pages project the columns they need
+    return FrameView(df_survey, rows), selected_filters, selections
@@ -0,0 +1,68 @@
+from navigation import make_sidebar
+import streamlit as st
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from tracing import cache_summary, caches, current_rss, is_admin, prometheus_text, registry, rerun_summary, stage_details, stage_summary
+
+make_sidebar()
+
+# Admins only: usernames listed under [metrics] admins in secrets
+if not st.session_state.get("logged_in", False) or not is_admin(st.session_state.get("username")):
+    st.error("This page is only available to dashboard admins.")
+    st.stop()
+
+st.title('Dashboard Metrics')
+
+spans = registry.frame()
+rss = current_rss()
+col1, col2 = st.columns(2)
+col1.metric("Process RSS", f"{rss / 2**20:.0f} MB" if rss is not None else "n/a")
+col2.metric("Recorded spans", len(spans))
+
+if spans.empty:
+    st.info("No spans recorded yet.")
+    st.stop()
+
+# Per-stage latency, rows and cache hit rate over the most recent spans
+st.subheader("Stages", divider='grey')
+st.dataframe(stage_summary(spans))
+
+# Figures stages report about their last run, e.g. the memory of the cleaned frames
+# before and after finalize_data's dtype optimization
+details = stage_details()
+if not details.empty:
+    st.write("Last reported figures per stage:")
+    st.dataframe(details)
+
+# Wall-time histogram of one stage since the server started
+stage = st.selectbox("Histogram for stage", options=sorted(registry.histograms))
+histogram = registry.histograms[stage]
+buckets = pd.DataFrame({
+    'le': [f"≤ {bound:g}s" for bound in histogram.buckets] + ['> ' + f"{histogram.buckets[-1]:g}s"],
+    'count': histogram.counts,
+})
+st.bar_chart(buckets.set_index('le'))
+
+# Process-wide result caches: a hit is a result computed once for another session
+# (or an earlier rerun) and reused
+if caches:
+    st.subheader("Result caches", divider='grey')
+    st.dataframe(cache_summary())
+
+# Reruns of every session, newest first, and the stages of this session's last rerun
+st.subheader("Reruns", divider='grey')
+st.dataframe(rerun_summary(spans))
+
+session_id = get_script_run_ctx().session_id
+own = spans[spans['session'] == session_id]
+if not own.empty:
+    st.write("Stages of your most recent traced rerun:")
+    previous = own[own['rerun'] == own['rerun'].max()]
+    st.dataframe(previous[['stage', 'seconds', 'rows', 'cache', 'rss_delta']])
+
+# Prometheus text format, for ad-hoc scrapes when no [metrics] port is configured
+st.subheader("Export", divider='grey')
+metrics_text = prometheus_text()
+st.download_button("Download Prometheus metrics", metrics_text, file_name='metrics.prom', mime='text/plain')
+with st.expander("Prometheus text"):
+    st.code(metrics_text, language='text')
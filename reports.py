@@ -0,0 +1,174 @@
+import base64
+import html
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+from filter_index import MIN_GROUP_SIZE, FilterIndex
+from ipa_chart import draw_ipa_scatter
+from ipa_engine import IPA_COLUMNS, ipa_midpoints, ipa_table, sufficient_stats
+from lazy_imports import lazy_import
+from snapshot import sheet_slug
+
+# Matplotlib only, so no browser or export server is needed for PNG and PDF
+figure = lazy_import('matplotlib.figure')
+backend_pdf = lazy_import('matplotlib.backends.backend_pdf')
+
+# Headless batch reports: the IPA and LS/NPS views of the dashboard for every value of
+# these columns, e.g. python reports.py --out reports --formats html pdf
+REPORT_COLUMNS = ['unit', 'subunit', 'division']
+REPORT_FORMATS = ['html', 'png', 'pdf']
+SEGMENT_COLUMNS = ['LS_Category', 'NPS_Category']
+
+# Slices of every report column, with the same confidentiality rule as make_filter;
+# returns (column, value, file stem, row positions) for the slices that may be shown
+# and for the withheld ones
+def report_segments(df_survey, columns=REPORT_COLUMNS):
+    columns = [column for column in columns if column in df_survey.columns]
+    index = FilterIndex(df_survey, columns)
+    segments, skipped = [], []
+    for column in columns:
+        stems = set()
+        for value in index.values[column]:
+            rows = index.positions(index.bitmap(column, [value]))
+            # Values like '-' or '#N/A' vs 'N/A' would share a file name
+            stem = name = sheet_slug(str(value)) or 'blank'
+            suffix = 1
+            while stem in stems:
+                suffix += 1
+                stem = f'{name}_{suffix}'
+            stems.add(stem)
+            (segments if len(rows) >= MIN_GROUP_SIZE else skipped).append((column, value, stem, rows))
+    return segments, skipped
+
+def draw_segment_bars(filtered_data, column):
+    # Count (percentage) per category, like the bar charts of the IPA x Cat page
+    counts = filtered_data[column].value_counts().loc[lambda counts: counts > 0]
+    fig = figure.Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    bars = ax.bar([str(label) for label in counts.index], counts.to_numpy())
+    ax.bar_label(bars, labels=[f"{count} ({count / counts.sum() * 100:.1f}%)" for count in counts.to_numpy()])
+    ax.set_title(f"Distribution by {column.replace('_', ' ')}", fontsize=14)
+    ax.set_ylabel('Count')
+    ax.tick_params(axis='x', labelrotation=15)
+    return fig
+
+def draw_table(df, title):
+    fig = figure.Figure(figsize=(10, 0.6 + 0.3 * (len(df) + 1)))
+    ax = fig.subplots()
+    ax.axis('off')
+    ax.set_title(title, fontsize=14)
+    table = ax.table(cellText=df.astype(str).to_numpy(), colLabels=list(df.columns), loc='center', cellLoc='left')
+    table.auto_set_font_size(False)
+    table.set_fontsize(7)
+    return fig
+
+def figure_bytes(fig, fmt='png', dpi=150):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    fig.clear()
+    return buffer.getvalue()
+
+def report_html(title, n_rows, correlation_df, images):
+    sections = ''.join(
+        f'<h2>{html.escape(name)}</h2><img src="data:image/png;base64,{base64.b64encode(data).decode()}" style="max-width:100%">'
+        for name, data in images.items()
+    )
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head><body>'
+            f'<h1>{html.escape(title)}</h1><p>{n_rows} respondents</p>'
+            f'<h2>Importance-Performance Analysis Table</h2>{correlation_df.to_html(index=False)}'
+            f'{sections}</body></html>')
+
+# Worker state: the report frame is sent once per process, tasks only carry row positions
+_report_frame = None
+
+def _init_worker(df):
+    global _report_frame
+    _report_frame = df
+
+def render_report(column, value, stem, rows, out_dir, formats=REPORT_FORMATS):
+    filtered_data = _report_frame.iloc[rows]
+    correlation_df = ipa_table(sufficient_stats(filtered_data[IPA_COLUMNS]))
+    importance_midpoint, performance_midpoint = ipa_midpoints(correlation_df)
+    title = f"{column.capitalize()}: {value}"
+    figures = {
+        'Importance-Performance Analysis': draw_ipa_scatter(correlation_df, importance_midpoint, performance_midpoint),
+        **{f"{segment.replace('_', ' ')}": draw_segment_bars(filtered_data, segment)
+           for segment in SEGMENT_COLUMNS if segment in filtered_data.columns},
+    }
+
+    base = Path(out_dir) / column / stem
+    base.parent.mkdir(parents=True, exist_ok=True)
+    files = []
+    if 'pdf' in formats:
+        with backend_pdf.PdfPages(f'{base}.pdf') as pdf:
+            pdf.savefig(draw_table(correlation_df, title), bbox_inches='tight')
+            for fig in figures.values():
+                pdf.savefig(fig, bbox_inches='tight')
+        files.append(f'{base}.pdf')
+    if 'png' in formats or 'html' in formats:
+        images = {name: figure_bytes(fig) for name, fig in figures.items()}
+        if 'png' in formats:
+            for name, data in images.items():
+                path = f'{base}_{sheet_slug(name)}.png'
+                Path(path).write_bytes(data)
+                files.append(path)
+        if 'html' in formats:
+            Path(f'{base}.html').write_text(report_html(title, len(filtered_data), correlation_df, images), encoding='utf-8')
+            files.append(f'{base}.html')
+    return {'column': column, 'value': str(value), 'respondents': len(filtered_data), 'files': files}
+
+# Render every segment on a process pool; returns the manifest (one row per report)
+def generate_reports(df_survey, out_dir, columns=REPORT_COLUMNS, formats=REPORT_FORMATS, workers=None):
+    segments, skipped = report_segments(df_survey, columns)
+    needed = list(dict.fromkeys(IPA_COLUMNS + [column for column in SEGMENT_COLUMNS if column in df_survey.columns]))
+    df = df_survey[needed]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker, initargs=(df,)) as pool:
+        futures = [pool.submit(render_report, *segment, out_dir, formats) for segment in segments]
+        for future in as_completed(futures):
+            results.append(future.result())
+    manifest = pd.DataFrame(results, columns=['column', 'value', 'respondents', 'files'])
+    manifest = manifest.sort_values(['column', 'value'], ignore_index=True)
+    withheld = pd.DataFrame([{'column': column, 'value': str(value), 'respondents': None, 'files': []}
+                             for column, value, _, _ in skipped], columns=manifest.columns)
+    index = pd.concat([manifest, withheld], ignore_index=True) if len(withheld) else manifest
+    write_index(index.astype({'respondents': 'Int64'}), out_dir)
+    return manifest
+
+def write_index(manifest, out_dir):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest.assign(files=manifest['files'].map(' '.join)).to_csv(out_dir / 'manifest.csv', index=False)
+    rows = []
+    for row in manifest.itertuples():
+        links = ' '.join(f'<a href="{html.escape(os.path.relpath(path, out_dir))}">{Path(path).suffix[1:]}</a>' for path in row.files)
+        shown = row.respondents if row.files else 'withheld (confidentiality)'
+        rows.append(f'<tr><td>{html.escape(row.column)}</td><td>{html.escape(row.value)}</td><td>{shown}</td><td>{links}</td></tr>')
+    (out_dir / 'index.html').write_text(
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Survey reports</title></head><body>'
+        '<h1>Survey reports</h1><table><tr><th>Column</th><th>Value</th><th>Respondents</th><th>Files</th></tr>'
+        + ''.join(rows) + '</table></body></html>', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    # python reports.py --out reports --columns unit subunit division --formats html png pdf
+    import argparse
+    from data_processing import finalize_data, load_wave
+    from fetch_data import SURVEY_YEAR
+
+    parser = argparse.ArgumentParser(description='Render the IPA and LS/NPS report of every unit, subunit and division.')
+    parser.add_argument('--out', type=Path, default=Path('reports'))
+    parser.add_argument('--columns', nargs='+', default=REPORT_COLUMNS)
+    parser.add_argument('--formats', nargs='+', choices=REPORT_FORMATS, default=REPORT_FORMATS)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--year', type=int, default=SURVEY_YEAR, help='survey wave; earlier waves come from the survey store')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df_survey = finalize_data()[0] if args.year == SURVEY_YEAR else load_wave(args.year)[0]
+    manifest = generate_reports(df_survey, args.out, args.columns, args.formats, args.workers)
+    print(f"Wrote {len(manifest)} reports for {len(df_survey)} respondents to {args.out} "
+          f"in {time.perf_counter() - start:.0f}s")
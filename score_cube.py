@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from filter_index import MIN_GROUP_SIZE, FilterIndex, cached_for_frame
+from ipa_cube import IPA_CUBE_PAIRS
+from survey_schema import DIMENSION_SCORES, ITEM_COLUMNS
+
+# Per-respondent dimension scores (see score_survey), then the items they average
+SCORE_COLUMNS = DIMENSION_SCORES + ITEM_COLUMNS
+
+STATS = ['n', 'mean', 'std']
+
+# n, mean and sample std per score from summed count / sum / sum of squares;
+# the arrays are (groups, scores) and the result has (stat, score) columns
+def score_stats(count, total, squares, scores, index=None):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = (squares - total * mean) / (count - 1)
+    std = np.sqrt(np.clip(variance, 0, None))
+    frames = {
+        'n': pd.DataFrame(count.astype(int), columns=scores, index=index),
+        'mean': pd.DataFrame(np.round(mean, 3), columns=scores, index=index),
+        'std': pd.DataFrame(np.round(std, 3), columns=scores, index=index),
+    }
+    return pd.concat(frames, axis=1)
+
+# Respondents grouped by every filterable column, keeping per cell the row count and,
+# per score, the count, sum and sum of squares of the answered rows. Any segment is
+# the sum of its matching cells and any rollup a groupby over the (few) cells.
+class ScoreCells:
+    def __init__(self, df, by, scores=SCORE_COLUMNS):
+        self.scores = [column for column in scores if column in df.columns]
+        by = [column for column in by if column in df.columns]
+
+        codes = df.groupby(by, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        values = df[self.scores].to_numpy(dtype=float, na_value=np.nan)
+        answered = ~np.isnan(values)
+        values = np.where(answered, values, 0)
+        sums = pd.DataFrame(np.hstack([np.ones((len(values), 1)), answered, values, values ** 2])).groupby(codes).sum().to_numpy()
+        width = len(self.scores)
+        self.rows = sums[:, 0]
+        self.count, self.total, self.squares = (sums[:, 1 + width * part:1 + width * (part + 1)] for part in range(3))
+
+        first_rows = np.unique(codes, return_index=True)[1]
+        self.keys = df[by].iloc[first_rows].reset_index(drop=True)
+        self.index = FilterIndex(self.keys, by)
+
+    def respondents(self, selections):
+        return int(self.rows[self.index.positions(self.index.mask(selections))].sum())
+
+    def segment(self, selections):
+        # One row of stats for the rows matching a filter selection
+        positions = self.index.positions(self.index.mask(selections))
+        sums = [part[positions].sum(axis=0, keepdims=True) for part in (self.count, self.total, self.squares)]
+        return score_stats(*sums, self.scores).iloc[0].unstack(0)[STATS]
+
+    def rollup(self, columns, selections=None):
+        # Stats per observed value combination of `columns` within a filter selection;
+        # groups under the confidentiality threshold are left out
+        positions = self.index.positions(self.index.mask(selections or {}))
+        by = [self.keys[column].iloc[positions] for column in columns]
+        grouped = [pd.DataFrame(part[positions], index=by[0].index).groupby(by, observed=True).sum()
+                   for part in (self.rows, self.count, self.total, self.squares)]
+        keep = grouped[0][0].to_numpy() >= MIN_GROUP_SIZE
+        rollup = score_stats(*(part.to_numpy()[keep] for part in grouped[1:]), self.scores, grouped[0].index[keep])
+        rollup.insert(0, 'respondents', grouped[0][0].to_numpy()[keep].astype(int))
+        return rollup
+
+# Headcount of the population per value combination of the same columns, for response
+# rates; columns the population frame does not fill are skipped
+class PopulationCells:
+    def __init__(self, df, by):
+        by = [column for column in by if column in df.columns and df[column].notna().any()]
+        if by and len(df):
+            counts = df.groupby(by, observed=True, dropna=False).size()
+            keys = counts.index.to_frame(index=False)
+        else:
+            by, counts, keys = [], pd.Series(dtype=int), pd.DataFrame()
+        self.columns = by
+        self.rows = counts.to_numpy()
+        self.keys = keys
+        self.index = FilterIndex(self.keys, by)
+
+    def has(self, selections):
+        return all(column in self.columns for column, values in selections.items() if values)
+
+    def headcount(self, selections):
+        if not self.has(selections):
+            return None
+        return int(self.rows[self.index.positions(self.index.mask(selections))].sum())
+
+    def rollup(self, columns, selections=None):
+        if not set(columns) <= set(self.columns) or not self.has(selections or {}):
+            return None
+        positions = self.index.positions(self.index.mask(selections or {}))
+        by = [self.keys[column].iloc[positions] for column in columns]
+        return pd.Series(self.rows[positions], index=by[0].index).groupby(by, observed=True).sum()
+
+# Score cube of one survey frame: rollups by every filter column and the IPA cube
+# pairs precomputed, anything else summed from the cells on demand
+class ScoreCube:
+    # population: combined_df, i.e. the respondents stacked on the SAP rows of the
+    # employees who have not answered, so together every employee
+    def __init__(self, df_survey, population, columns, pairs=IPA_CUBE_PAIRS):
+        self.cells = ScoreCells(df_survey, columns)
+        self.population = PopulationCells(population, columns)
+        groupings = [(column,) for column in columns] + [pair for pair in pairs if set(pair) <= set(columns)]
+        self.rollups = {grouping: self.cells.rollup(list(grouping)) for grouping in groupings
+                        if set(grouping) <= set(self.cells.keys.columns)}
+
+    def segment(self, selections):
+        return self.cells.segment(selections)
+
+    def rollup(self, columns, selections=None):
+        # Unfiltered rollups are kept; drill-downs inside a filter sum the matching cells
+        columns = tuple(columns)
+        if any((selections or {}).values()):
+            return self.cells.rollup(list(columns), selections)
+        if columns not in self.rollups:
+            self.rollups[columns] = self.cells.rollup(list(columns))
+        return self.rollups[columns]
+
+    def heatmap(self, columns, selections=None, scores=DIMENSION_SCORES):
+        # Mean score per group, groups as rows and scores as columns
+        return self.rollup(columns, selections)['mean'][[score for score in scores if score in self.cells.scores]]
+
+    def response_rate(self, selections):
+        respondents = self.cells.respondents(selections)
+        headcount = self.population.headcount(selections)
+        return respondents, headcount, respondents / headcount if headcount else None
+
+    def response_rates(self, columns, selections=None):
+        headcount = self.population.rollup(list(columns), selections)
+        if headcount is None:
+            return None
+        respondents = self.rollup(columns, selections)['respondents']
+        rates = pd.DataFrame({'respondents': respondents, 'headcount': headcount}).dropna(subset=['headcount'])
+        # Groups under the confidentiality threshold (missing from the rollup) show
+        # their headcount only
+        shown = rates['respondents'].notna()
+        rates['response_rate'] = (rates['respondents'] / rates['headcount']).round(3).where(shown)
+        return rates.astype({'headcount': int, 'respondents': 'Int64'})
+
+def get_score_cube(df_survey, combined_df, columns):
+    return cached_for_frame(df_survey, ('score_cube', tuple(columns)), lambda: ScoreCube(df_survey, combined_df, columns))
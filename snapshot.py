@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local Parquet snapshots of the Google Sheets, so a cold start reads from disk
+SNAPSHOT_DIR = Path(os.environ.get('SURVEY_SNAPSHOT_DIR', '.snapshots'))
+SNAPSHOT_TTL = int(os.environ.get('SURVEY_SNAPSHOT_TTL', 15 * 60))  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+def sheet_slug(name):
+    # 'Employee Survey 2024' -> 'employee_survey_2024', used for file and table names
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def snapshot_path(name):
+    return SNAPSHOT_DIR / f'{sheet_slug(name)}.parquet'
+
+
+def frame_revision(df):
+    # Content hash of the frame, used as the sheet revision downstream
+    hashed = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    columns = '\x1f'.join(map(str, df.columns)).encode()
+    return hashlib.sha1(columns + hashed.tobytes()).hexdigest()[:16]
+
+
+def mixed_columns(df):
+    # get_all_records() mixes ints and strings in one column ('#N/A', ''), which
+    # Arrow cannot store, so those columns are written as text and re-numericised on read
+    return [
+        column for column in df.columns
+        if pd.api.types.infer_dtype(df[column], skipna=False) in ('mixed', 'mixed-integer', 'mixed-integer-float')
+    ]
+
+
+LINEAGE_KEYS = ['base_revision', 'base_rows']
+
+
+def write_table_atomic(table, path):
+    # Each writer gets its own temp file next to the target, so concurrent writers of
+    # the same sheet never clobber each other; the rename is atomic, so readers never
+    # see a half-written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp', delete=False) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_snapshot(name, df, revision=None, lineage=None):
+    # lineage: {'base_revision', 'base_rows'} when df is an earlier snapshot plus
+    # appended rows, so consumers can process just the rows past base_rows
+    mixed = mixed_columns(df)
+    stored = df.astype({column: str for column in mixed})
+    revision = revision or frame_revision(df)
+    table = pa.Table.from_pandas(stored, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b'snapshot': json.dumps({
+            'revision': revision,
+            'fetched_at': time.time(),
+            'mixed_columns': mixed,
+            'rows': len(df),
+            **(lineage or {}),
+        }).encode(),
+    })
+
+    write_table_atomic(table, snapshot_path(name))
+
+    df = df.copy()
+    df.attrs['revision'] = revision
+    df.attrs.update(lineage or {})
+    return df
+
+
+def snapshot_info(name):
+    path = snapshot_path(name)
+    if not path.exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if b'snapshot' not in metadata:
+        return None
+    info = json.loads(metadata[b'snapshot'])
+    # A refresh that found no new rows only touches the file
+    info['fetched_at'] = max(info['fetched_at'], path.stat().st_mtime)
+    return info
+
+
+def numericise_column(text):
+    # Vectorized gspread.utils.numericise: ints stay ints, floats floats, the rest text
+    restored = text.astype(object)
+    numbers = pd.to_numeric(text, errors='coerce')
+    is_number = numbers.notna()
+    is_int = is_number & text.str.fullmatch(r'-?\d+')
+    restored[is_int] = numbers[is_int].astype('int64').astype(object)
+    restored[is_number & ~is_int] = numbers[is_number & ~is_int].astype(object)
+    return restored
+
+
+def read_snapshot(name):
+    info = snapshot_info(name)
+    if info is None:
+        return None
+    df = pq.read_table(snapshot_path(name)).to_pandas()
+    for column in info['mixed_columns']:
+        df[column] = numericise_column(df[column])
+    df.attrs['revision'] = info['revision']
+    df.attrs.update({key: info[key] for key in LINEAGE_KEYS if key in info})
+    return df
+
+
+def is_stale(info, ttl=SNAPSHOT_TTL):
+    return info is None or time.time() - info['fetched_at'] > ttl
+
+
+def append_snapshot(name, info, fetch_since):
+    # Append-only sheets: fetch only the rows past the snapshot and append them.
+    # None when the sheet no longer extends the snapshot (rows removed, new header)
+    if info.get('rows') is None:
+        return None
+    new_rows = fetch_since(info['rows'])
+    if new_rows is None:
+        return None
+    base = read_snapshot(name)
+    if list(new_rows.columns) != list(base.columns):
+        return None
+    if new_rows.empty:
+        snapshot_path(name).touch()
+        return base
+    df = pd.concat([base, new_rows], ignore_index=True)
+    revision = hashlib.sha1((info['revision'] + frame_revision(new_rows)).encode()).hexdigest()[:16]
+    return write_snapshot(name, df, revision, {'base_revision': info['revision'], 'base_rows': info['rows']})
+
+
+def load_snapshot(name, fetch, ttl=SNAPSHOT_TTL, fetch_since=None):
+    # Read-through: serve the local snapshot while fresh, otherwise fetch and rewrite it
+    # (appending only the new rows when the sheet is append-only)
+    info = snapshot_info(name)
+    if not is_stale(info, ttl):
+        return read_snapshot(name)
+    try:
+        if info is not None and fetch_since is not None:
+            df = append_snapshot(name, info, fetch_since)
+            if df is not None:
+                return df
+        return write_snapshot(name, fetch())
+    except Exception:
+        # Sheets unreachable: fall back to the stale snapshot if we have one
+        if info is None:
+            raise
+        logger.warning("Refreshing snapshot %r failed; serving the one fetched %.0fs ago",
+                       name, time.time() - info['fetched_at'], exc_info=True)
+        return read_snapshot(name)
+
+
+def invalidate_snapshot(name=None):
+    # Drop one snapshot (or all of them) so the next load goes back to Sheets
+    paths = [snapshot_path(name)] if name is not None else SNAPSHOT_DIR.glob('*.parquet')
+    for path in paths:
+        path.unlink(missing_ok=True)
@@ -2,24 +2,24 @@ import streamlit as st
 from time import sleep
 from navigation import make_sidebar
 import streamlit_authenticator as stauth
-from data_processing import finalize_data
-import gspread
-from datetime import datetime, timedelta
-from oauth2client.service_account import ServiceAccountCredentials
+from data_processing import load_credentials, prefetch_data
+from fetch_data import SURVEY_YEAR
+import copy
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from access_log import get_access_log
+from tracing import start_metrics_export
 
 st.set_page_config(
-    page_title='Survey Result 2024',
+    page_title=f'Survey Result {SURVEY_YEAR}',
     page_icon=':blue_heart:', 
 )
 
-# Fetch the credentials from the data source
-df_survey, df_creds, combined_df = finalize_data()
-
-# Process `df_creds` to extract credentials in the required format
-def extract_credentials(df_creds):
+# Process the cached username-indexed credentials into the required format
+def extract_credentials(users):
     credentials = {
         "credentials": {
-            "usernames": {}
+            # Copied per run: the authenticator writes login state into this dict
+            "usernames": copy.deepcopy(users)
         },
         "cookie": {
             "name": "growth_center",
@@ -27,17 +27,13 @@ def extract_credentials(df_creds):
             "expiry_days": 30
         }
     }
-    for index, row in df_creds.iterrows():
-        credentials['credentials']['usernames'][row['username']] = {
-            'name': row['name'],  # Add the 'name' field
-            'password': row['password'],  # Password should already be hashed
-            'unit': row['unit'],  # Store the user's unit for later filtering
-            'email': row['email'],  # Add the email field
-        }
     return credentials
 
-# Extract credentials from df_creds
-credentials = extract_credentials(df_creds)
+# Serves /metrics when [metrics] port is configured
+start_metrics_export()
+
+# Only the small credentials sheet is needed to show the login form
+credentials = extract_credentials(load_credentials())
 
 # Authentication Setup
 authenticator = stauth.Authenticate(
@@ -53,7 +49,7 @@ if st.session_state.get("logged_in", False):
     make_sidebar()
 
 # Display the title of the app
-st.title("Employee Survey 2024")
+st.title(f"Employee Survey {SURVEY_YEAR}")
 st.title("Result Dashboard")
 
 # Display the login form
@@ -63,6 +59,9 @@ authenticator.login('main')
 if st.session_state.get('authentication_status'):
     st.session_state['logged_in'] = True  # Set session state for logged in
     st.success("Logged in successfully!")
+
+    # Start loading the survey and SAP data while the user looks at the landing page
+    prefetch_data()
     
     username = st.session_state['username']
 
@@ -70,25 +69,8 @@ if st.session_state.get('authentication_status'):
     user_email = credentials['credentials']['usernames'][username]['email']
     user_name = credentials['credentials']['usernames'][username]['name']
 
-        #ACCESS LOG
-    def log_user_access(email):
-        access_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Setup the Google Sheets client
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["sheets"], scope)
-        client = gspread.authorize(creds)
-        
-        try:
-            spreadsheet_id = "1qUZaGkwv7Shx3gDnSQNdYFOjuqmVtRUEgKzdrBrsovM"  # Replace with your actual spreadsheet ID
-            sheet = client.open_by_key(spreadsheet_id).sheet1  # Use open_by_key instead of open
-            sheet.append_row([email, access_time])
-        except gspread.SpreadsheetNotFound:
-            st.write("Spreadsheet not found. Please check the ID and permissions.")
-        except Exception as e:
-            st.write(f"An error occurred: {e}")
-    # Get the user's email from Streamlit's experimental_user function
-    log_user_access(user_email)
+    # ACCESS LOG: queued here, written to the sink in batches by a background worker
+    get_access_log().log(user_email, get_script_run_ctx().session_id)
 
 elif st.session_state.get('authentication_status') is False:
     st.error("Incorrect username or password.")
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# The survey instrument in one place: cleaning, scoring, the IPA and the score cube all
+# read their item lists from here, so a new item, dimension or survey version is an
+# edit to this module only
+
+# Answer scales: (lowest, highest) answer
+SCALES = {
+    'likert': (1, 5),
+    'nps': (0, 10),
+}
+
+# Dimensions in questionnaire order: the driver items, then the overall question of the
+# dimension. Its score is the (weighted) mean of all its answered items. fill_overall:
+# a missing or 0 overall answer is replaced by the rounded mean of the drivers.
+DIMENSIONS = {
+    'KD': {'name': 'Kebutuhan Dasar', 'drivers': ['KD1', 'KD2', 'KD3'], 'overall': 'KD0'},
+    'KI': {'name': 'Kontribusi Individu', 'drivers': ['KI1', 'KI2', 'KI3', 'KI4', 'KI5'], 'overall': 'KI0'},
+    'KR': {'name': 'Kerjasama', 'drivers': ['KR1', 'KR2', 'KR3', 'KR4', 'KR5'], 'overall': 'KR0'},
+    'PR': {'name': 'Pertumbuhan', 'drivers': ['PR1', 'PR2'], 'overall': 'PR0'},
+    'TU': {'name': 'Tujuan', 'drivers': ['TU1', 'TU2'], 'overall': 'TU0'},
+    'KE': {'name': 'Keterlekatan', 'drivers': ['KE1', 'KE2', 'KE3'], 'overall': 'KE0', 'fill_overall': True},
+}
+
+# Questions outside the dimensions; SAT is the outcome of the IPA
+QUESTIONS = {
+    'SAT': {'name': 'Overall Satisfaction', 'scale': 'likert'},
+    'NPS': {'name': 'Net Promoter Score', 'scale': 'nps'},
+}
+OUTCOME = 'SAT'
+
+# Item weights within a dimension score; items not listed weigh 1
+ITEM_WEIGHTS = {}
+
+def dimension_items(dimension):
+    return dimension['drivers'] + [dimension['overall']]
+
+def score_column(code):
+    return f'average_{code.lower()}'
+
+DIMENSION_ITEMS = [item for dimension in DIMENSIONS.values() for item in dimension_items(dimension)]
+DIMENSION_SCORES = [score_column(code) for code in DIMENSIONS]
+# Importance-Performance drivers: every driver item, in questionnaire order
+DRIVERS = [item for dimension in DIMENSIONS.values() for item in dimension['drivers']]
+ITEM_COLUMNS = DIMENSION_ITEMS + list(QUESTIONS)
+ITEM_SCALES = {**{item: 'likert' for item in DIMENSION_ITEMS},
+               **{question: spec['scale'] for question, spec in QUESTIONS.items()}}
+
+# Score column -> dimension name, for display
+SCORE_NAMES = {score_column(code): dimension['name'] for code, dimension in DIMENSIONS.items()}
+
+# Item x dimension weight matrix over DIMENSION_ITEMS; drivers_only leaves the overall
+# questions out (for the fill_overall means)
+def dimension_weights(drivers_only=False):
+    weights = np.zeros((len(DIMENSION_ITEMS), len(DIMENSIONS)))
+    position = {item: row for row, item in enumerate(DIMENSION_ITEMS)}
+    for column, dimension in enumerate(DIMENSIONS.values()):
+        for item in dimension['drivers'] if drivers_only else dimension_items(dimension):
+            weights[position[item], column] = ITEM_WEIGHTS.get(item, 1.0)
+    return weights
+
+# Weighted mean of the answered items per row and dimension, in one multiply of the
+# answer and answered-mask blocks with the weight matrix; rows with no answered item
+# in a dimension get NaN
+def weighted_means(values, weights):
+    answered = ~np.isnan(values)
+    sums, counts = np.stack([np.where(answered, values, 0), answered]) @ weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts
+
+# Dimension scores of every row, rounded to 2 decimals, with the fill_overall items
+# filled first; returns the updated item columns and the score columns
+def score_dimensions(df):
+    values = df[DIMENSION_ITEMS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    filled = {}
+    fill = [(column, dimension['overall']) for column, dimension in enumerate(DIMENSIONS.values()) if dimension.get('fill_overall')]
+    if fill:
+        driver_means = weighted_means(values, dimension_weights(drivers_only=True))
+        for column, overall in fill:
+            position = DIMENSION_ITEMS.index(overall)
+            answer = values[:, position]
+            missing = np.isnan(answer) | (answer == 0)
+            values[:, position] = np.where(missing, np.round(driver_means[:, column]), answer)
+            filled[overall] = values[:, position]
+    scores = np.round(weighted_means(values, dimension_weights()), 2)
+    return {**filled, **{score: scores[:, column] for column, score in enumerate(DIMENSION_SCORES)}}
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from snapshot import mixed_columns
+
+# Cleaned survey waves, partitioned as <table>/year=<year>/unit=<unit>/part-0.parquet,
+# so readers only open the partitions of the years and units they ask for
+SURVEY_STORE_DIR = Path(os.environ.get('SURVEY_STORE_DIR', '.survey_store'))
+
+PARTITIONING = ds.partitioning(pa.schema([('unit', pa.string())]), flavor='hive')
+
+def wave_path(table, year):
+    return SURVEY_STORE_DIR / table / f'year={year}'
+
+def wave_info(year):
+    path = SURVEY_STORE_DIR / '_waves' / f'{year}.json'
+    return json.loads(path.read_text()) if path.exists() else None
+
+def stored_years():
+    return sorted(int(path.name.split('=', 1)[1]) for path in (SURVEY_STORE_DIR / 'survey').glob('year=*'))
+
+def _write_partitions(df, path):
+    # Unit becomes the directory name, so it is written as plain text (as are
+    # columns mixing numbers and text, which Arrow cannot store)
+    stored = df.astype({'unit': str, **{column: str for column in mixed_columns(df)}})
+    table = pa.Table.from_pandas(stored, preserve_index=False)
+    # Own temp directory per writer (stays empty when there are no rows)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp'))
+    try:
+        ds.write_dataset(table, tmp_path, format='parquet', partitioning=PARTITIONING,
+                         basename_template='part-{i}.parquet', existing_data_behavior='overwrite_or_ignore')
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    # Swap the whole year in; readers skip dot-prefixed directories
+    old_path = tmp_path.with_suffix('.old')
+    if path.exists():
+        path.rename(old_path)
+    tmp_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+_write_lock = threading.Lock()
+
+# Replace one wave in the store; skipped when that revision is already stored
+def write_wave(year, revision, frames):
+    with _write_lock:
+        return _write_wave(year, revision, frames)
+
+def _write_wave(year, revision, frames):
+    info = wave_info(year)
+    if info is not None and info['revision'] == revision:
+        return False
+    for table, df in frames.items():
+        path = wave_path(table, year)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_partitions(df, path)
+    info_path = SURVEY_STORE_DIR / '_waves' / f'{year}.json'
+    info_path.parent.mkdir(parents=True, exist_ok=True)
+    info_path.write_text(json.dumps({'revision': revision, 'rows': {table: len(df) for table, df in frames.items()}}))
+    return True
+
+# Read a table for some years, with the unit filter pushed down to the partition
+# directories and only the requested columns decoded
+def read_waves(table, years=None, units=None, columns=None):
+    frames = []
+    for year in years if years is not None else stored_years():
+        path = wave_path(table, year)
+        if not path.exists() or not any(path.glob('*/*.parquet')):
+            continue
+        dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+        expression = ds.field('unit').isin([str(unit) for unit in units]) if units is not None else None
+        df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        frames.append(df.assign(year=year))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if 'unit' in df.columns:
+        df['unit'] = df['unit'].astype('category')
+    return df
+
+
+if __name__ == '__main__':
+    # Batch stage: python survey_store.py, e.g. when a wave closes or after the sheets
+    # are refreshed; the dashboard only reads the store
+    from data_processing import store_wave
+    from fetch_data import SURVEY_YEAR
+
+    written = store_wave()
+    print(f"{'Wrote' if written else 'Already stored:'} survey wave {SURVEY_YEAR} in {SURVEY_STORE_DIR}")
@@ -0,0 +1,291 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Wall-time buckets (seconds) shared by every stage histogram
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Most recent spans kept for the per-session and per-rerun views
+RECENT_SPANS = 5000
+
+def current_rss():
+    # Resident set size in bytes: psutil when installed, /proc elsewhere on Linux
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+class Histogram:
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+SPAN_FIELDS = ['stage', 'session', 'rerun', 'started', 'seconds', 'rows', 'cache', 'rss_delta']
+
+# One record per finished span; stage histograms and counters are process-wide,
+# so they cover every session served by this server
+class SpanRegistry:
+    def __init__(self, recent=RECENT_SPANS):
+        self.histograms = {}
+        self.rows = {}
+        self.cache = {}
+        self.rss_delta = {}
+        self.details = {}
+        self.spans = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.histograms.setdefault(span['stage'], Histogram()).observe(span['seconds'])
+            self.rows[span['stage']] = self.rows.get(span['stage'], 0) + (span['rows'] or 0)
+            if span['cache'] is not None:
+                key = (span['stage'], span['cache'])
+                self.cache[key] = self.cache.get(key, 0) + 1
+            if span['rss_delta'] is not None:
+                self.rss_delta[span['stage']] = self.rss_delta.get(span['stage'], 0) + span['rss_delta']
+            if span['details']:
+                self.details[span['stage']] = span['details']
+            self.spans.append(span)
+
+    def frame(self):
+        with self._lock:
+            return pd.DataFrame(list(self.spans), columns=SPAN_FIELDS)
+
+registry = SpanRegistry()
+
+_active = threading.local()
+
+class Span:
+    def __init__(self, stage, rows=None, cached=False):
+        self.stage = stage
+        self.rows = rows
+        self.cache = 'hit' if cached else None
+        self.details = {}
+
+    def miss(self):
+        self.cache = 'miss'
+
+# Rerun counter of each session, kept in its session state so it goes with the session
+RERUN_KEY = '_trace_rerun'
+
+def _rerun(ctx):
+    return ctx.session_state[RERUN_KEY] if RERUN_KEY in ctx.session_state else 0
+
+def _session():
+    # Session id and rerun number of the Streamlit script run on this thread, if any
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None, None
+    return ctx.session_id, _rerun(ctx)
+
+# Called once at the top of every page run, so spans can be grouped per rerun
+def begin_rerun():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        ctx.session_state[RERUN_KEY] = _rerun(ctx) + 1
+
+# with span('finalize_data', cached=True) as s: ... -- times the block and records
+# rows (set s.rows inside the block when it is only known at the end), the RSS
+# delta of the process and, for cached stages, hit unless mark_miss() was called
+@contextmanager
+def span(stage, rows=None, cached=False):
+    current = Span(stage, rows, cached)
+    stack = _active.__dict__.setdefault('stack', [])
+    stack.append(current)
+    rss_before = current_rss()
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        rss_after = current_rss()
+        session, rerun = _session()
+        registry.record({
+            'stage': stage, 'session': session, 'rerun': rerun, 'started': started,
+            'seconds': seconds, 'rows': current.rows, 'cache': current.cache,
+            'rss_delta': None if rss_before is None or rss_after is None else rss_after - rss_before,
+            'details': current.details,
+        })
+
+# Called from inside a cached function body: the enclosing span on this thread was a miss
+def mark_miss():
+    stack = getattr(_active, 'stack', None)
+    if stack:
+        stack[-1].miss()
+
+# Called from inside a traced stage: named figures of the run (e.g. memory before and
+# after), kept per stage as of its last run that set them
+def annotate(**details):
+    stack = getattr(_active, 'stack', None)
+    if stack:
+        stack[-1].details.update(details)
+
+def stage_details(registry=registry):
+    with registry._lock:
+        return pd.DataFrame.from_dict(registry.details, orient='index')
+
+# Process-wide result caches (anything with stats()) reported next to the spans
+caches = {}
+
+def register_cache(name, cache):
+    caches[name] = cache
+    return cache
+
+def cache_summary():
+    return pd.DataFrame.from_dict({name: cache.stats() for name, cache in sorted(caches.items())}, orient='index')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Prometheus text exposition format (version 0.0.4)
+def prometheus_text(registry=registry):
+    with registry._lock:
+        lines = [
+            '# HELP dashboard_stage_seconds Wall time of each dashboard stage.',
+            '# TYPE dashboard_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(registry.histograms.items()):
+            label = f'stage="{_escape(stage)}"'
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'dashboard_stage_seconds_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f'dashboard_stage_seconds_sum{{{label}}} {histogram.sum}')
+            lines.append(f'dashboard_stage_seconds_count{{{label}}} {histogram.count}')
+
+        lines += ['# HELP dashboard_stage_rows_total Rows processed by each stage.',
+                  '# TYPE dashboard_stage_rows_total counter']
+        lines += [f'dashboard_stage_rows_total{{stage="{_escape(stage)}"}} {rows}' for stage, rows in sorted(registry.rows.items())]
+
+        lines += ['# HELP dashboard_stage_cache_total Cache lookups of cached stages by result.',
+                  '# TYPE dashboard_stage_cache_total counter']
+        lines += [f'dashboard_stage_cache_total{{stage="{_escape(stage)}",result="{result}"}} {count}'
+                  for (stage, result), count in sorted(registry.cache.items())]
+
+        lines += ['# HELP dashboard_stage_rss_delta_bytes Sum of the process RSS change across each stage.',
+                  '# TYPE dashboard_stage_rss_delta_bytes gauge']
+        lines += [f'dashboard_stage_rss_delta_bytes{{stage="{_escape(stage)}"}} {delta}' for stage, delta in sorted(registry.rss_delta.items())]
+
+        cache_stats = {name: cache.stats() for name, cache in sorted(caches.items())}
+        lines += ['# HELP dashboard_result_cache_total Lookups of the process-wide result caches by result.',
+                  '# TYPE dashboard_result_cache_total counter']
+        for name, stats in cache_stats.items():
+            lines.append(f'dashboard_result_cache_total{{cache="{_escape(name)}",result="hit"}} {stats["hits"]}')
+            lines.append(f'dashboard_result_cache_total{{cache="{_escape(name)}",result="miss"}} {stats["misses"]}')
+        lines += ['# HELP dashboard_result_cache_entries Entries held by each result cache.',
+                  '# TYPE dashboard_result_cache_entries gauge']
+        lines += [f'dashboard_result_cache_entries{{cache="{_escape(name)}"}} {stats["entries"]}' for name, stats in cache_stats.items()]
+
+        lines += ['# HELP dashboard_stage_detail Figures reported by the last run of each stage.',
+                  '# TYPE dashboard_stage_detail gauge']
+        lines += [f'dashboard_stage_detail{{stage="{_escape(stage)}",name="{_escape(name)}"}} {value}'
+                  for stage, details in sorted(registry.details.items()) for name, value in sorted(details.items())]
+
+        rss = current_rss()
+        if rss is not None:
+            lines += ['# HELP dashboard_process_rss_bytes Resident set size of the server process.',
+                      '# TYPE dashboard_process_rss_bytes gauge', f'dashboard_process_rss_bytes {rss}']
+    return '\n'.join(lines) + '\n'
+
+# Per-stage summary of the recent spans for the metrics page
+def stage_summary(spans):
+    if spans.empty:
+        return pd.DataFrame()
+    grouped = spans.groupby('stage')
+    cached = spans.dropna(subset=['cache'])
+    summary = pd.DataFrame({
+        'count': grouped.size(),
+        'p50_ms': grouped['seconds'].quantile(0.5) * 1000,
+        'p95_ms': grouped['seconds'].quantile(0.95) * 1000,
+        'max_ms': grouped['seconds'].max() * 1000,
+        'rows': grouped['rows'].sum(),
+        'hit_rate': cached['cache'].eq('hit').groupby(cached['stage']).mean(),
+        'rss_delta_mb': grouped['rss_delta'].sum() / 2**20,
+    })
+    return summary.round(2)
+
+# Totals per session and rerun: time and RSS change summed over the spans of each run
+def rerun_summary(spans):
+    if spans.empty:
+        return pd.DataFrame()
+    runs = spans.dropna(subset=['session']).groupby(['session', 'rerun'])
+    return pd.DataFrame({
+        'started': pd.to_datetime(runs['started'].min(), unit='s'),
+        'spans': runs.size(),
+        'seconds': runs['seconds'].sum(),
+        'rss_delta_mb': runs['rss_delta'].sum() / 2**20,
+    }).round(3).sort_values('started', ascending=False)
+
+
+# Optional [metrics] secrets section: admins = ["username", ...] may open the metrics
+# page, port = 9102 also serves /metrics for a Prometheus scraper
+def metrics_config():
+    try:
+        return dict(st.secrets.get('metrics', {}))
+    except FileNotFoundError:
+        return {}
+
+def is_admin(username):
+    return username is not None and username in metrics_config().get('admins', [])
+
+def start_metrics_export():
+    port = metrics_config().get('port')
+    if port:
+        start_metrics_server(int(port))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port, host='0.0.0.0'):
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+        return _server